@@ -2,9 +2,9 @@ import dash
 import dash_bootstrap_components as dbc
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 
-from datetime import datetime as dt
+from datetime import datetime as dt, timezone
 import pandas as pd
 import geopandas
 import plotly.express as px
@@ -18,17 +18,74 @@ from graphs.time import time_graph
 from graphs.prediction import prediction_graph 
 from graphs.aftershocks import aftershocks_graph 
 from graphs.tsunami import tsunami_graph 
+from graphs.events import EventFrame
+from graphs.viewport import map_view, viewport
+from graphs.encoding import compact_figure
+from graphs.lod import density_cell
+from storage.aggregates import DEPTH_EDGES, MAG_EDGES
+
+from storage.cache import LRUCache
+from storage.columns import empty_columns
+from storage.mongo import MongoCatalog
 
 from pymongo import MongoClient
+import os
+import json
 
 ###
 # Configuration
 ###
 
-# Connect to database
-connection = MongoClient("mongodb://localhost:27017/")
-db = connection["map-earthquake-data"]
-collection = db.earthquakes
+# Maximum number of events per filter result; the strongest events are kept and the scatter maps thin them out
+QUERY_LIMIT = 100000
+
+# Select the backend: "mongo" (default) or "parquet", the columnar copy written by export_parquet.py
+backend = os.environ.get("EARTHQUAKE_BACKEND", "mongo")
+
+if backend == "parquet":
+    from storage.parquet import ParquetCatalog
+    catalog = ParquetCatalog(os.environ.get("EARTHQUAKE_PARQUET", "resources/catalog"))
+else:
+    # Connect to database
+    connection = MongoClient("mongodb://localhost:27017/")
+    db = connection["map-earthquake-data"]
+    collection = db.earthquakes
+    catalog = MongoCatalog(collection)
+
+def prepare_catalog():
+    ''' Makes sure the filters of the sidebar are answered from an index. This needs the database, so it runs when
+    the app is started instead of when the module is imported. '''
+    if not isinstance(catalog, MongoCatalog):
+        return
+
+    catalog.ensure_indexes()
+    default_range = [dt(2011, 3, 1, tzinfo=timezone.utc).timestamp() * 1000,
+                     dt(2011, 4, 30, tzinfo=timezone.utc).timestamp() * 1000]
+    catalog.verify_indexes([
+        default_range + [[2, 10], [0, 300]],
+        default_range + [[2, 10], [0, 300], "japan"],
+        [dt(2000, 1, 1, tzinfo=timezone.utc).timestamp() * 1000, dt.now(timezone.utc).timestamp() * 1000, [7, 10],
+         [0, 700]],
+    ], limit=QUERY_LIMIT)
+
+# Filter results are kept on the server; the browser only holds the key of a result
+result_cache = LRUCache(max_entries=32, max_age=3600, version=catalog.version)
+
+def load_events(key):
+    if not key:
+        return EventFrame(empty_columns())
+
+    def compute():
+        query = json.loads(key)
+        limit = query.pop("limit")
+        series = json.dumps({name: value for name, value in query.items() if name != "bounds"}, sort_keys=True)
+        return EventFrame(catalog.query(limit=limit, **query), lambda cell: catalog.aggregate(cell=cell, **query),
+                          lambda period: catalog.rollup(period=period, **query), series)
+
+    return result_cache.get_or_compute(key, compute)
+
+# Rendered main graphs, so that returning to a tab or option shows its figure without drawing it again
+figure_cache = LRUCache(max_entries=64, max_age=3600, version=catalog.version)
 
 # Set mapbox
 px.set_mapbox_access_token("pk.eyJ1IjoidHJvdzEyIiwiYSI6ImNrOWNvOGpiajAwemozb210ZGttNXpoemUifQ.HtK_x39UnnD2_bXveR9nsQ")
@@ -44,6 +101,7 @@ tab_map_options = [
     ], 
     [ # All clustering options
         {'label': 'K-means Clustering', 'value': 'K-means-Clustering'},
+        {'label': 'Mini-batch K-means Clustering', 'value': 'MiniBatch-K-means'},
         {'label': 'Agglomerative Hierarchical Clustering', 'value': 'Agglomerative'},
         {'label': 'Density based spatial clustering', 'value': 'DBSCAN'},
         {'label': 'OPTICS clustering', 'value': 'OPTICS'}
@@ -60,8 +118,9 @@ tab_map_options = [
         {'label': 'Scatterplot', 'value': 'Scatter'},
         {'label': 'Density map', 'value': 'Densitymap'},
     ], 
-    [ # To be filled by Jeroen
+    [ # Tsunami analyses
         {'label': 'Scatterplot', 'value': 'Scatter'},
+        {'label': 'Offshore distance', 'value': 'Distance'},
     ], 
 ]
 
@@ -230,6 +289,7 @@ def bootstrap(view):
     app.layout = html.Div(
     [
         dcc.Store(id='storage'),
+        dcc.Store(id='viewport'),
         get_header(),
         get_tabs(view),
         html.Div(
@@ -260,34 +320,47 @@ app = bootstrap(tabs[0])
 def tab_changed(view):
     return [get_sidebar_left(view), get_graph(view)]
 
+@app.callback(
+    Output('viewport', 'data'),
+    [Input('graph', 'relayoutData'),
+     Input("tabs", "active_tab"),
+     Input('main-map-selector', 'value')])
+def update_viewport(relayout, view, option):
+    # Only the map that is on screen restricts the filters; another tab or figure starts from the whole world
+    triggered = [trigger["prop_id"] for trigger in dash.callback_context.triggered]
+    if "graph.relayoutData" not in triggered:
+        return None
+    return map_view(relayout)
+
 @app.callback(
     Output('storage', 'data'),
     [Input('start-date', 'date'),
      Input('end-date', 'date'),
      Input('magnitude-range', 'value'),
      Input('depth-range', 'value'),
-     Input('location-selector', 'value')])
-def filter_data(start_date, end_date, mag_range, depth_range, location):
+     Input('location-selector', 'value'),
+     Input('viewport', 'data')])
+def filter_data(start_date, end_date, mag_range, depth_range, location, relayout):
     if None in [mag_range, depth_range, start_date, end_date]:
-        return {}
+        return None
     
-    start_date = dt.strptime(start_date, '%Y-%m-%d').timestamp() * 1000
-    end_date = dt.strptime(end_date, '%Y-%m-%d').timestamp() * 1000
-
-    query = {
-        "properties.mag" : {"$gte": mag_range[0], "$lte": mag_range[1]},
-        "properties.time": {"$gte":start_date, "$lte": end_date},
-        "geometry.coordinates.2": {"$gte": depth_range[0], "$lte": depth_range[1]},
-    }
-
-    if location is not None:
-        query["properties.place"] = {"$regex": location, '$options': 'gi'}
-
-    print (query)
-
-    earthquakes = list(collection.find(query, {'_id': False}).limit(5000))
-
-    return earthquakes
+    # The dates are days in UTC, like the stored times, the cube and the rollups
+    start_date = dt.strptime(start_date, '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp() * 1000
+    end_date = dt.strptime(end_date, '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp() * 1000
+
+    # The normalized query is the key, so any worker can recompute a result that is not in its cache
+    key = json.dumps({
+        "start": start_date,
+        "end": end_date,
+        "mag_range": [float(value) for value in mag_range],
+        "depth_range": [float(value) for value in depth_range],
+        "location": location,
+        "bounds": viewport(relayout)[0],
+        "limit": QUERY_LIMIT,
+    }, sort_keys=True)
+    load_events(key)
+
+    return key
 
 @app.callback(
     Output('graph', 'figure'),
@@ -297,30 +370,41 @@ def filter_data(start_date, end_date, mag_range, depth_range, location):
      Input('number-of-clusters', 'value'),
      Input('color-scale', 'value'),
      Input("tabs", "active_tab"),
-     Input("location-selector", "value")])
-def update_main_graph(dic, option, mag_range, n_clusters, colorscale, view, location):
-    return tab_graphs[tabs.index(view)](dic, option, mag_range, n_clusters, colorscale, location)
+     Input("location-selector", "value")],
+    [State('viewport', 'data')])
+def update_main_graph(key, option, mag_range, n_clusters, colorscale, view, location, relayout):
+    zoom = viewport(relayout)[1]
+    events = load_events(key)
+
+    def render():
+        fig = tab_graphs[tabs.index(view)](events, option, mag_range, n_clusters, colorscale, location, zoom)
+        if not isinstance(fig, go.Figure):
+            return fig
+
+        # Keep the zoom of the map when the data of the visible region is replaced
+        fig.update_layout(uirevision=view)
+        return compact_figure(fig)
+
+    # The rollups and aggregates depend on the query, not only on the loaded events
+    figure_key = json.dumps([key, events.fingerprint(), view, option, mag_range, n_clusters, colorscale, location,
+                             zoom])
+    return figure_cache.get_or_compute(figure_key, render)
 
 
 @app.callback(
     Output('hist_of_mag', 'figure'),
-    [Input('storage', 'data')])
-def update_side_graphs(earthquakes):
+    [Input('storage', 'data')],
+    [State('viewport', 'data')])
+def update_side_graphs(key, relayout):
+    # Histograms over all matching events, binned by the catalog
+    aggregates = load_events(key).aggregates(density_cell(viewport(relayout)[1]))
     fig = make_subplots(rows=1, cols=2)
-    trace0 = go.Histogram(x=[item['properties']['mag'] for item in earthquakes], name='Magnitudes',
-                        xbins=dict(
-                            start=2.5,
-                            end=10,
-                            size=1
-                        ), marker_color='#5fc861'
-                        )
-    trace1 = go.Histogram(x=[item['geometry']['coordinates'][2] for item in earthquakes], name='Depth distribution',
-                        xbins=dict(
-                            start=-800,
-                            end=0,
-                            size=50,
-                        ), marker_color='#3e4989'
-                        )
+    trace0 = go.Bar(x=(MAG_EDGES[:-1] + MAG_EDGES[1:]) / 2, y=aggregates['mag'], name='Magnitudes',
+                    width=MAG_EDGES[1] - MAG_EDGES[0], marker_color='#5fc861'
+                    )
+    trace1 = go.Bar(x=(DEPTH_EDGES[:-1] + DEPTH_EDGES[1:]) / 2, y=aggregates['depth'], name='Depth distribution',
+                    width=DEPTH_EDGES[1] - DEPTH_EDGES[0], marker_color='#3e4989'
+                    )
 
     fig.append_trace(trace0, 1, 1)
     fig.append_trace(trace1, 1, 2)
@@ -329,4 +413,5 @@ def update_side_graphs(earthquakes):
     return fig
 
 if __name__ == '__main__':
+    prepare_catalog()
     app.run_server(debug=True)
\ No newline at end of file
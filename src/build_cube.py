@@ -0,0 +1,27 @@
+''' This module rebuilds the cube of event counts from all stored earthquakes. Afterwards the cube is kept up to date
+by the retrieval scripts, so this is only needed once or after the cube dimensions change. '''
+
+import pymongo
+
+from ingest.engine import BATCH_SIZE
+from ingest.stream import batches
+from storage.cube import CUBE_COLLECTION, PROJECTION, ensure_cube_indexes, mark_built, update_cube
+
+# Connect to the db
+mongo = pymongo.MongoClient("mongodb://localhost:27017/")
+db = mongo["map-earthquake-data"]
+collection = db["earthquakes"]
+cube = db[CUBE_COLLECTION]
+
+cube.drop()
+ensure_cube_indexes(cube)
+
+total = 0
+for events in batches(collection.find({}, PROJECTION), BATCH_SIZE):
+    update_cube(cube, [], events, rebuilding=True)
+    total += len(events)
+    print("Added", total, "earthquakes to the cube")
+
+mark_built(cube)
+
+print("The cube has been rebuilt!")
@@ -0,0 +1,28 @@
+''' This module rebuilds the magnitude rollups from all stored earthquakes. Afterwards the rollups are kept up to date
+by the retrieval scripts, so this is only needed once or after the region tags have changed. '''
+
+import pymongo
+
+from ingest.engine import BATCH_SIZE
+from ingest.stream import batches
+from storage.cube import mark_built
+from storage.rollups import ROLLUP_COLLECTION, PROJECTION, ensure_rollup_indexes, update_rollups
+
+# Connect to the db
+mongo = pymongo.MongoClient("mongodb://localhost:27017/")
+db = mongo["map-earthquake-data"]
+collection = db["earthquakes"]
+rollups = db[ROLLUP_COLLECTION]
+
+rollups.drop()
+ensure_rollup_indexes(rollups)
+
+total = 0
+for events in batches(collection.find({}, PROJECTION), BATCH_SIZE):
+    update_rollups(rollups, collection, [], events, rebuilding=True)
+    total += len(events)
+    print("Added", total, "earthquakes to the rollups")
+
+mark_built(rollups)
+
+print("The rollups have been rebuilt!")
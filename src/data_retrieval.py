@@ -1,63 +1,46 @@
-''' This module retrieves the data from the usgs serves and stores it in monodb. It updated the data every time it runs.'''
+''' This module retrieves the data from the usgs serves and stores it in monodb. It updated the data every time it runs.
+Windows are fetched concurrently and finished windows are checkpointed, so an interrupted run can simply be restarted.
+After the first complete backfill only the events updated since the previous run are requested. '''
+
+import argparse
+from datetime import datetime
 
-import requests
 import pymongo
-from datetime import datetime, timedelta
 
-# Connect to the db
-mongo = pymongo.MongoClient("mongodb://localhost:27017/")
-collection = mongo["map-earthquake-data"]["earthquakes"]
+from ingest.engine import EPOCH, Checkpoint, make_windows, run, sync
+from ingest.fdsn import USGS_URL, FdsnClient
+from ingest.store import SyncState, ensure_indexes
+
+parser = argparse.ArgumentParser(description="Retrieve earthquakes from the USGS FDSN service.")
+parser.add_argument("--workers", type=int, default=8, help="number of windows fetched at once")
+parser.add_argument("--start", default=EPOCH.strftime("%Y-%m-%d"), help="first day to retrieve (yyyy-mm-dd)")
+parser.add_argument("--base-url", default=USGS_URL, help="FDSN event service, e.g. a local stand-in server")
+parser.add_argument("--mongo", default="mongodb://localhost:27017/")
+parser.add_argument("--full", action="store_true", help="walk all windows instead of a delta sync")
+args = parser.parse_args()
 
-# Select the date to start from
-latest_event = collection.find_one({}, sort=[("properties.time", pymongo.DESCENDING)])
-if latest_event is not None:
-    start_datetime = datetime.fromtimestamp(latest_event["properties"]["time"] / 1000)
+# Connect to the db
+mongo = pymongo.MongoClient(args.mongo)
+db = mongo["map-earthquake-data"]
+collection = db["earthquakes"]
+ensure_indexes(collection)
+
+client = FdsnClient(args.base_url, pool_size=args.workers)
+state = SyncState(db["sync"])
+last_sync = state.last_sync()
+started = datetime.utcnow()
+
+if last_sync is None or args.full:
+    windows = make_windows(datetime.strptime(args.start, "%Y-%m-%d"))
+    total, failed = run(client, collection, Checkpoint(db["checkpoints"]), windows, workers=args.workers)
+
+    # Only a complete backfill can serve as the starting point of delta syncs
+    if not failed:
+        state.update(started)
 else:
-    start_datetime = datetime.strptime("January 1, 2000", "%B %d, %Y")
-
-while True: 
-    # set the end_datetime
-    end_datetime = start_datetime + timedelta(days=30)  
-    month_iteration = 0
-
-    print("Searching for earthquakes from",start_datetime.strftime("%Y-%m-%d"),"to",end_datetime.strftime("%Y-%m-%d"))
-
-    while True:
-        # Build the url
-        url = "https://earthquake.usgs.gov/fdsnws/event/1/query"
-        url += "?format=geojson"
-        url += "&orderby=time-asc"
-        url += "&limit=20000"
-        url += "&offset=" + str(month_iteration * 20000 + 1)
-        url += "&starttime=" + start_datetime.strftime("%Y-%m-%d")
-        url += "&endtime=" + end_datetime.strftime("%Y-%m-%d")
-
-        # Retrieve the corresponding earthquakes
-        response = requests.get(url)
-        json = response.json()
-        events = json["features"]
-        
-        print("Found",len(events),"earthquakes")
-
-        # Insert all found events
-        collection.insert_many(events)
-
-        # Reiterate the month if we found more than 20k, continue with the next otherwise
-        if len(events) >= 20000:
-            month_iteration += 1
-            print("Searching for more iterations in the current month")
-        else:
-            start_datetime = end_datetime
-            break
-    
-    # Stop searching if we surpassed the current date
-    if start_datetime > datetime.now():
-        break
-
-# Remove all documents where one or more coordinate or magnitude values is not defined
-collection.remove({ "$or": [
-    { "geometry.coordinates": None },
-    { "properties.mag": None }
-]})
-
-print("The earthquake register has been updated!")
\ No newline at end of file
+    sync(client, collection, last_sync, workers=args.workers)
+    state.update(started)
+
+client.close()
+
+print("The earthquake register has been updated!")
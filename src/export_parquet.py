@@ -0,0 +1,21 @@
+''' This module copies the earthquakes from mongodb to the columnar parquet catalog that the app can read instead. '''
+
+import argparse
+
+import pymongo
+
+from storage.parquet import ParquetCatalog, export
+
+parser = argparse.ArgumentParser(description="Export the earthquake collection to parquet files partitioned by year.")
+parser.add_argument("--path", default="resources/catalog", help="directory of the parquet catalog")
+parser.add_argument("--first-year", type=int, default=2000)
+parser.add_argument("--mongo", default="mongodb://localhost:27017/")
+args = parser.parse_args()
+
+# Connect to the db
+mongo = pymongo.MongoClient(args.mongo)
+collection = mongo["map-earthquake-data"]["earthquakes"]
+
+export(collection, ParquetCatalog(args.path), first_year=args.first_year)
+
+print("The parquet catalog has been updated!")
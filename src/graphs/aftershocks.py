@@ -1,25 +1,53 @@
 import plotly.graph_objects as go
-from datetime import datetime as dt
 import plotly.express as px
 
-def aftershocks_graph(data, option, min_mag, n_clusters, colorscale, location):
-    lon = [item['geometry']['coordinates'][0] for item in data]
-    lat = [item['geometry']['coordinates'][1] for item in data]
-    size = [item['properties']['sig'] for item in data]
-    time = [dt.fromtimestamp(item['properties']['time']/1000) for item in data]
-    mag = [item['properties']['mag'] for item in data]
-    place = [item['properties']['place'] for item in data]
-    hours = [str(time[i].hour) + "-" + str(time[i].day) for i in range(len(time))]
+from graphs.animation import animated_scatter
+from graphs.declustering import sequence_events
+from graphs.lod import decimate, density_cell
+from storage.aggregates import grid_counts
 
+COLORS = {"mainshock": "#d62728", "aftershock": "#1f77b4"}
+
+def aftershocks_graph(events, option, min_mag, n_clusters, colorscale, location, zoom):
     if option is None:
         return {}
 
+    # Only the events of detected aftershock sequences are drawn
+    sequence, labels, number = sequence_events(events)
+    if len(sequence) == 0:
+        return {}
+    df = sequence.frame.assign(type=labels, sequence=number)
+
     if option == 'Scatter-time':
-        fig = px.scatter_mapbox(data, lat=lat, lon=lon, color=mag, range_color=[2.5, 10],
-        size=size, hover_name=time,
-        color_continuous_scale='viridis', size_max=10, zoom=1, opacity=0.6,
-        animation_frame=hours)
-        
+        def draw(indices, counts):
+            frame = df.iloc[indices].assign(count=counts)
+            fig = px.scatter_mapbox(frame, lat='lat', lon='long', color='type', color_discrete_map=COLORS,
+            size='sig', hover_name='time', hover_data=['mag', 'sequence', 'count'],
+            size_max=10, zoom=1, opacity=0.6)
+            return fig, frame['type'].to_numpy()
+
+        return animated_scatter(sequence, zoom, 'aftershocks', draw)
+
+    if option == 'Scatter':
+        # Sequences never share a cell, so every sequence stays visible
+        indices, counts = decimate(sequence, zoom, by=number)
+        fig = px.scatter_mapbox(df.iloc[indices].assign(count=counts), lat='lat', lon='long', color='type',
+                                color_discrete_map=COLORS, size='mag', hover_name='time',
+                                hover_data=['mag', 'sequence', 'count'], size_max=10, zoom=0.6, opacity=0.7,
+                                title="Aftershock sequences",
+                                labels={'lat': "latitude",
+                                        'long': "longitude",
+                                        'mag': 'Magnitude',
+                                        'count': 'events in area'})
+
+        return fig
+
+    if option == 'Densitymap':
+        aftershocks = labels == "aftershock"
+        density = grid_counts(sequence.lon[aftershocks], sequence.lat[aftershocks], density_cell(zoom))
+        fig = px.density_mapbox(lat=density['lat'], lon=density['lon'], z=density['count'], radius=5, zoom=0.6,
+                                color_continuous_scale=colorscale, labels={'z': 'aftershocks'})
+
         return fig
 
-    return {}
\ No newline at end of file
+    return {}
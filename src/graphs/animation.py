@@ -0,0 +1,109 @@
+''' Animated scatter maps over time. The events are put in at most MAX_FRAMES chronological time bins, whose length
+follows from the selected period. The figure holds every drawn event once, in its base traces; a frame only selects
+the points of its bin, and the other points are hidden. Figures are cached per filter result and zoom level. '''
+
+import numpy as np
+import pandas as pd
+
+from graphs.lod import decimate
+from storage.cache import LRUCache
+
+MAX_FRAMES = 48
+
+HOUR = 3600 * 1000
+DAY = 24 * HOUR
+
+# Candidate bin lengths with the format of their labels, from short to long
+BIN_LENGTHS = [
+    (HOUR, "%Y-%m-%d %H:00"),
+    (3 * HOUR, "%Y-%m-%d %H:00"),
+    (6 * HOUR, "%Y-%m-%d %H:00"),
+    (12 * HOUR, "%Y-%m-%d %H:00"),
+    (DAY, "%Y-%m-%d"),
+    (2 * DAY, "%Y-%m-%d"),
+    (7 * DAY, "%Y-%m-%d"),
+    (14 * DAY, "%Y-%m-%d"),
+    (30 * DAY, "%Y-%m-%d"),
+    (91 * DAY, "%Y-%m-%d"),
+    (365 * DAY, "%Y-%m-%d"),
+]
+
+# Milliseconds per animation frame
+FRAME_DURATION = 500
+
+# Animated figures per (data fingerprint, view, zoom level)
+frame_cache = LRUCache(max_entries=16)
+
+
+def time_bins(epoch_ms, max_frames=MAX_FRAMES):
+    ''' Returns the bin of every event and the labels of all bins, using the shortest bin length that needs at most
+    max_frames bins. '''
+    first, last = int(epoch_ms.min()), int(epoch_ms.max())
+    for length, label_format in BIN_LENGTHS:
+        if last // length - first // length < max_frames:
+            break
+
+    start = first // length
+    bins = (np.asarray(epoch_ms, dtype=np.int64) // length - start).astype(np.int64)
+    starts = pd.to_datetime((start + np.arange(bins.max() + 1)) * length, unit="ms")
+    return bins, list(starts.strftime(label_format))
+
+
+def animation_controls(labels):
+    ''' Returns the play buttons and the slider of an animation over the labelled frames. '''
+    play = {"frame": {"duration": FRAME_DURATION, "redraw": True}, "fromcurrent": True,
+            "transition": {"duration": 0}}
+    jump = {"frame": {"duration": 0, "redraw": True}, "mode": "immediate", "transition": {"duration": 0}}
+    return {
+        "updatemenus": [{
+            "type": "buttons", "direction": "left", "showactive": False, "x": 0.1, "y": 0, "xanchor": "right",
+            "yanchor": "top", "pad": {"r": 10, "t": 70},
+            "buttons": [
+                {"label": "&#9654;", "method": "animate", "args": [None, play]},
+                {"label": "&#9724;", "method": "animate", "args": [[None], jump]},
+            ],
+        }],
+        "sliders": [{
+            "active": 0, "x": 0.1, "y": 0, "xanchor": "left", "yanchor": "top", "len": 0.9, "pad": {"b": 10, "t": 60},
+            "currentvalue": {"prefix": "Period starting "},
+            "steps": [{"label": label, "method": "animate", "args": [[label], jump]} for label in labels],
+        }],
+    }
+
+
+def animate(fig, bins, labels, groups=None):
+    ''' Turns a scatter map of points sorted by bin into an animation with a frame per bin. When the figure has a
+    trace per group, e.g. per discrete color, groups holds the trace name of every point. '''
+    selections = []
+    for trace in fig.data:
+        rows = np.arange(len(bins)) if groups is None else np.flatnonzero(groups == trace.name)
+        bounds = np.searchsorted(bins[rows], np.arange(len(labels) + 1))
+        selections.append([list(range(bounds[frame], bounds[frame + 1])) for frame in range(len(labels))])
+
+    opacity = fig.data[0].marker.opacity if fig.data else None
+    fig.update_traces(selected={"marker": {"opacity": opacity}}, unselected={"marker": {"opacity": 0}})
+    for trace, selection in zip(fig.data, selections):
+        trace.selectedpoints = selection[0]
+
+    # Frames only carry the selected points of every trace; the type keeps plotly from defaulting to a scatter
+    fig.frames = [{"name": label,
+                   "data": [{"type": trace.type, "selectedpoints": selection[frame]}
+                            for trace, selection in zip(fig.data, selections)],
+                   "traces": list(range(len(selections)))}
+                  for frame, label in enumerate(labels)]
+    fig.update_layout(**animation_controls(labels))
+    return fig
+
+
+def animated_scatter(events, zoom, view, draw):
+    ''' Returns the cached animation of the events. Draw makes the scatter map of the events at the given indices,
+    with the number of events each point stands for, and returns the figure and the trace name of every point. '''
+    def compute():
+        bins, labels = time_bins(events.epoch_ms)
+        indices, counts = decimate(events, int(zoom or 0), by=bins)
+        order = np.lexsort((indices, bins[indices]))
+        indices, counts = indices[order], counts[order]
+        fig, groups = draw(indices, counts)
+        return animate(fig, bins[indices], labels, groups)
+
+    return frame_cache.get_or_compute((events.fingerprint(), view, int(zoom or 0)), compute)
@@ -1,100 +1,173 @@
-import pandas as pd
-import plotly.express as px
-from sklearn.cluster import KMeans, AgglomerativeClustering, DBSCAN, OPTICS
-from datetime import datetime as dt
-import numpy as np
-
-def clustering_graph(data, option, min_mag, n_clusters, colorscale, location):
-
-    if option is None:
-        return {}
+import heapq
 
+import numpy as np
+import plotly.express as px
+from sklearn.cluster import KMeans, MiniBatchKMeans, DBSCAN, cluster_optics_xi
+from sklearn.metrics import pairwise_distances_argmin_min
+
+from graphs.hierarchical import agglomerative
+from graphs.lod import decimate
+from graphs.spatial import EARTH_RADIUS_KM
+from storage.cache import LRUCache
+
+# Cluster labels per (data fingerprint, algorithm, number of clusters), so that e.g. a tab change does not refit
+label_cache = LRUCache(max_entries=16)
+
+# Centroids of the last mini-batch fit per filter series and number of clusters, used to start the next fit from
+previous_centroids = LRUCache(max_entries=32)
+
+# Neighbourhood radius and minimum neighbourhood size of the density based clusterings
+EPS_KM = 100
+MIN_SAMPLES = 4
+
+# The previous centroids are reused while the new events lie at most this much further from them, on average, than
+# the events they were fitted on
+MAX_SHIFT = 2.0
+
+def cluster_figure(events, labels, column, zoom):
+    # Clusters are computed on all events, only the drawing is thinned out
+    indices, counts = decimate(events, zoom)
+    df = events.frame.assign(**{column: labels}).iloc[indices].assign(count=counts)
+    fig = px.scatter_mapbox(df, lat='lat', lon='long', color=column,
+                            size='mag', hover_name='time', hover_data=['count'], size_max=10, zoom=0.8, opacity=0.7,
+                            labels={column: "Cluster Number",
+                                    'lat': "latitude",
+                                    'long': "longitude",
+                                    'mag': 'Magnitude'}
+                            )
+
+    return fig
+
+def minibatch_kmeans(x_array, n_clusters, series=None):
+    ''' Fits mini-batch K-means, refining the centroids of the previous fit of the same filters, e.g. before the map
+    was panned, when the events have only shifted a bit. '''
+    key = (series, n_clusters)
+    previous = previous_centroids.get(key) if series is not None else None
+
+    if previous is not None:
+        centroids, spread = previous
+        distances = pairwise_distances_argmin_min(x_array, centroids)[1]
+        if (distances ** 2).mean() <= MAX_SHIFT * spread:
+            model = MiniBatchKMeans(n_clusters=n_clusters, init=centroids, n_init=1, batch_size=1024)
+        else:
+            model = MiniBatchKMeans(n_clusters=n_clusters, batch_size=1024)
+    else:
+        model = MiniBatchKMeans(n_clusters=n_clusters, batch_size=1024)
+
+    labels = model.fit_predict(x_array)
+    if series is not None:
+        previous_centroids.put(key, (model.cluster_centers_, model.inertia_ / len(x_array)))
+    return labels
+
+def optics_ordering(graph, max_eps, min_samples):
+    ''' Computes the OPTICS ordering, reachability and predecessors from a precomputed radius graph whose rows are
+    sorted by distance and include the event itself. The result equals compute_optics_graph of scikit-learn, which
+    the pinned version cannot run on a sparse graph; the next event is taken from a heap instead of a scan over all
+    unprocessed events. '''
+    n = graph.shape[0]
+    indptr, indices, distances = graph.indptr, graph.indices, graph.data
+
+    # The core distance is the distance to the min_samples-th neighbour, the event itself included
+    core = np.full(n, np.inf)
+    counts = np.diff(indptr)
+    cores = np.flatnonzero(counts >= min_samples)
+    core[cores] = distances[indptr[cores] + min_samples - 1]
+    core[core > max_eps] = np.inf
+
+    reachability = np.full(n, np.inf)
+    predecessor = np.full(n, -1, dtype=np.int64)
+    processed = np.zeros(n, dtype=bool)
+    ordering = np.empty(n, dtype=np.int64)
+    heap = []
+    unreached = 0
+    for position in range(n):
+        # The unprocessed event with the smallest reachability, ties and unreachable events in index order
+        point = -1
+        while heap:
+            reach, candidate = heapq.heappop(heap)
+            if not processed[candidate] and reach == reachability[candidate]:
+                point = candidate
+                break
+        if point < 0:
+            while processed[unreached]:
+                unreached += 1
+            point = unreached
+
+        processed[point] = True
+        ordering[position] = point
+        if core[point] == np.inf:
+            continue
+
+        neighbours = indices[indptr[point]:indptr[point + 1]]
+        reach = np.maximum(distances[indptr[point]:indptr[point + 1]], core[point])
+        keep = (reach <= max_eps) & ~processed[neighbours]
+        neighbours, reach = neighbours[keep], reach[keep]
+        improved = reach < reachability[neighbours]
+        reachability[neighbours[improved]] = reach[improved]
+        predecessor[neighbours[improved]] = point
+        for value, neighbour in zip(reach[improved].tolist(), neighbours[improved].tolist()):
+            heapq.heappush(heap, (value, neighbour))
+
+    return ordering, reachability, predecessor
+
+def optics_labels(graph, max_eps, min_samples):
+    ''' Runs OPTICS with the default xi cluster extraction on a precomputed radius graph. '''
+    # Fewer events than a neighbourhood holds are all noise
+    if graph.shape[0] < min_samples:
+        return np.full(graph.shape[0], -1, dtype=np.int64)
+
+    ordering, reachability, predecessor = optics_ordering(graph, max_eps, min_samples)
+    return cluster_optics_xi(reachability=reachability, predecessor=predecessor, ordering=ordering,
+                             min_samples=min_samples)[0]
+
+def cluster_labels(events, option, n_clusters):
+    if len(events) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    # There cannot be more clusters than events
+    n_clusters = min(n_clusters, len(events))
+    x_array = events.coordinates()
     if option == "K-means-Clustering":
-        df = pd.DataFrame()
         kmeans = KMeans(n_clusters=n_clusters)
-        df['long'] = [item['geometry']['coordinates'][0] for item in data]
-        df['lat'] = [item['geometry']['coordinates'][1] for item in data]
-        df['mag'] = [item['properties']['mag'] for item in data]
-        df['time'] = [dt.fromtimestamp(item['properties']['time']/1000) for item in data]
-
-        kmeans.fit(df[['long', 'lat']].to_numpy())
-        df['cluster_nr'] = kmeans.predict(df[['long', 'lat']].to_numpy())
+        kmeans.fit(x_array)
+        return kmeans.predict(x_array)
 
-        fig = px.scatter_mapbox(df, lat='lat', lon='long', color='cluster_nr',
-                                size='mag', hover_name='time', size_max=10, zoom=0.8, opacity=0.7,
-                                labels={'cluster_nr': "Cluster Number",
-                                        'lat': "latitude",
-                                        'lon': "longitude",
-                                        'size': 'Magnitude'}
-                                )
-
-        return fig
+    if option == "MiniBatch-K-means":
+        return minibatch_kmeans(x_array, n_clusters, events.series)
 
     if option == "Agglomerative":
-        df = pd.DataFrame()
-        agglo = AgglomerativeClustering(n_clusters=n_clusters, distance_threshold=None)
-        df['long'] = [item['geometry']['coordinates'][0] for item in data]
-        df['lat'] = [item['geometry']['coordinates'][1] for item in data]
-        df['mag'] = [item['properties']['mag'] for item in data]
-        df['time'] = [dt.fromtimestamp(item['properties']['time'] / 1000) for item in data]
-        agglo.fit(df[['long', 'lat']].to_numpy())
-        df['cluster_nr'] = agglo.labels_
-
-        fig = px.scatter_mapbox(df, lat='lat', lon='long', color='cluster_nr',
-                                size='mag', hover_name='time',
-                                size_max=10, zoom=0.8, opacity=0.7,
-                                labels={'cluster_nr': "Cluster Number",
-                                        'lat': "latitude",
-                                        'lon': "longitude",
-                                        'size': 'Magnitude'}
-                                )
-
-        return fig
+        return agglomerative(x_array[:, 0], x_array[:, 1], n_clusters)
 
+    # DBSCAN and OPTICS read the neighbourhoods from the shared spatial index
     if option == "DBSCAN":
-        df = pd.DataFrame()
-        df['long'] = [item['geometry']['coordinates'][0] for item in data]
-        df['lat'] = [item['geometry']['coordinates'][1] for item in data]
-        df['mag'] = [item['properties']['mag'] for item in data]
-        df['time'] = [dt.fromtimestamp(item['properties']['time'] / 1000) for item in data]
-
-        x_array = df[['long', 'lat']].to_numpy()
-        db = DBSCAN(eps=100 / 6371., min_samples=4, algorithm='auto', metric='haversine').fit(np.radians(x_array))
-        df['DBSCAN_cluster'] = db.labels_
-
-        fig = px.scatter_mapbox(df, lat='lat', lon='long', color='DBSCAN_cluster', size='mag',
-                                hover_name='time',
-                                size_max=10, zoom=0.8, opacity=0.7,
-                                labels={'DBSCAN_cluster': "Cluster Number",
-                                        'lat': "latitude",
-                                        'lon': "longitude",
-                                        'size': 'Magnitude'}
-                                )
-
-        return fig
-
+        graph = events.spatial_index().radius_graph(EPS_KM)
+        db = DBSCAN(eps=EPS_KM / EARTH_RADIUS_KM, min_samples=MIN_SAMPLES, metric='precomputed', n_jobs=-1).fit(graph)
+        return db.labels_
 
     if option == "OPTICS":
-        df = pd.DataFrame()
-        df['long'] = [item['geometry']['coordinates'][0] for item in data]
-        df['lat'] = [item['geometry']['coordinates'][1] for item in data]
-        df['mag'] = [item['properties']['mag'] for item in data]
-        df['time'] = [dt.fromtimestamp(item['properties']['time'] / 1000) for item in data]
+        graph = events.spatial_index().radius_graph(EPS_KM)
+        return optics_labels(graph, EPS_KM / EARTH_RADIUS_KM, MIN_SAMPLES)
 
-        x_array = df[['long', 'lat']].to_numpy()
+    return None
 
-        optics = OPTICS(min_samples=4, eps=100 / 6371., metric='haversine').fit(np.radians(x_array))
-        df['optics_cluster'] = optics.labels_
+def clustering_graph(events, option, min_mag, n_clusters, colorscale, location, zoom):
 
-        fig = px.scatter_mapbox(df, lat='lat', lon='long', color='optics_cluster', size='mag',
-                                hover_name='time', size_max=10, zoom=0.8, opacity=0.7,
-                                labels={'optics_cluster': "Cluster Number",
-                                        'lat': "latitude",
-                                        'lon': "longitude",
-                                        'size': 'Magnitude'}
-                                )
+    if option is None:
+        return {}
 
-        return fig
+    columns = {
+        "K-means-Clustering": 'cluster_nr',
+        "MiniBatch-K-means": 'cluster_nr',
+        "Agglomerative": 'cluster_nr',
+        "DBSCAN": 'DBSCAN_cluster',
+        "OPTICS": 'optics_cluster',
+    }
+    if option not in columns:
+        return {}
 
-    return {}
+    # Only the algorithms that take a number of clusters depend on it
+    parameters = n_clusters if columns[option] == 'cluster_nr' else (EPS_KM, MIN_SAMPLES)
+    labels = label_cache.get_or_compute((events.fingerprint(), option, parameters),
+                                        lambda: cluster_labels(events, option, n_clusters))
 
+    return cluster_figure(events, labels, columns[option], zoom)
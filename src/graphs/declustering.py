@@ -0,0 +1,90 @@
+''' Gardner-Knopoff declustering: every event that falls within the space-time window of a stronger event is marked as
+its aftershock. Events are visited from strong to weak; the candidates of a mainshock are looked up in the shared
+spatial index and then restricted to its time window, so events are never compared pairwise. '''
+
+import numpy as np
+
+from storage.cache import LRUCache
+
+BACKGROUND, MAINSHOCK, AFTERSHOCK = 0, 1, 2
+LABELS = np.array(["background", "mainshock", "aftershock"])
+
+MS_PER_DAY = 24 * 3600 * 1000
+
+# Number of mainshock candidates whose neighbourhoods are queried at once
+CHUNK_SIZE = 1024
+
+# Declustering results per data fingerprint
+sequence_cache = LRUCache(max_entries=16)
+
+
+def window_km(mag):
+    return 10 ** (0.1238 * mag + 0.983)
+
+
+def window_days(mag):
+    return np.where(mag >= 6.5, 10 ** (0.032 * mag + 2.7389), 10 ** (0.5409 * mag - 0.547))
+
+
+def decluster(events):
+    ''' Returns for every event its label and the index of its mainshock, which is -1 for background events. '''
+    n = len(events)
+    labels = np.full(n, BACKGROUND, dtype=np.int8)
+    mainshock = np.full(n, -1, dtype=np.int64)
+    if n == 0:
+        return labels, mainshock
+
+    mag = events.mag.astype(np.float64)
+    time = events.epoch_ms
+    radius = window_km(mag)
+    duration = window_days(mag) * MS_PER_DAY
+    index = events.spatial_index()
+
+    order = np.argsort(-mag, kind="mergesort")
+    for start in range(0, n, CHUNK_SIZE):
+        chunk = order[start:start + CHUNK_SIZE]
+        chunk = chunk[mainshock[chunk] == -1]
+        if len(chunk) == 0:
+            continue
+
+        neighbours = index.within(chunk, radius[chunk])
+        sizes = np.fromiter((len(candidates) for candidates in neighbours), np.int64, len(chunk))
+        owner = np.repeat(chunk, sizes)
+        candidate = np.concatenate(neighbours).astype(np.int64)
+
+        # Most events have no candidate at all; only the others are visited one by one
+        delay = time[candidate] - time[owner]
+        keep = (delay > 0) & (delay <= duration[owner]) & (mag[candidate] <= mag[owner]) & (mainshock[candidate] == -1)
+        owner, candidate = owner[keep], candidate[keep]
+        if len(owner) == 0:
+            continue
+        bounds = np.flatnonzero(np.r_[True, owner[1:] != owner[:-1], True])
+
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            event = owner[first]
+            # Events can be taken by a stronger event of the same chunk
+            if mainshock[event] != -1:
+                continue
+
+            aftershocks = candidate[first:last]
+            aftershocks = aftershocks[mainshock[aftershocks] == -1]
+            if len(aftershocks):
+                labels[event] = MAINSHOCK
+                mainshock[event] = event
+                labels[aftershocks] = AFTERSHOCK
+                mainshock[aftershocks] = event
+
+    return labels, mainshock
+
+
+def sequences(events):
+    ''' Returns the cached declustering of the events. '''
+    return sequence_cache.get_or_compute(events.fingerprint(), lambda: decluster(events))
+
+
+def sequence_events(events):
+    ''' Returns the events of all aftershock sequences, their labels and the number of their sequence. '''
+    labels, mainshock = sequences(events)
+    indices = np.flatnonzero(labels != BACKGROUND)
+    number = np.unique(mainshock[indices], return_inverse=True)[1]
+    return events.subset(indices), LABELS[labels[indices]], number
@@ -0,0 +1,97 @@
+''' Compact encoding of figures for the browser. Dash serializes callback outputs with the plotly JSON encoder, which
+handles numpy arrays element by element; figures are therefore converted to plain JSON types up front, with numeric
+arrays rounded and dates formatted in one vectorized step. With typed arrays enabled, numeric and date arrays are sent
+as base64 encoded binary instead, which requires plotly.js 2.28 or later in the browser; the plotly.js of the pinned
+dash-core-components only reads plain lists. '''
+
+import base64
+import os
+from datetime import datetime
+
+import numpy as np
+
+TYPED_ARRAYS = os.environ.get("EARTHQUAKE_TYPED_ARRAYS") == "1"
+
+# Decimals kept of floating point values. The event columns are float32, of which more decimals are noise; four
+# decimals are about ten metres in coordinates and far below the magnitude precision
+DECIMALS = {np.dtype(np.float32): 4, np.dtype(np.float64): 6}
+
+INT32 = np.iinfo(np.int32)
+
+# Trace attributes that are sent as numbers when they hold dates
+DATE_AXES = ("x", "y")
+
+# Trace attributes that can be typed arrays: coordinates, marker sizes and colors, e.g. magnitudes, and custom data
+TYPED_KEYS = ("x", "y", "z", "lat", "lon", "size", "color", "customdata")
+
+
+def typed_array(array):
+    ''' Returns the plotly.js typed array specification of a numeric array. '''
+    if array.dtype.kind in "iub" and (array.size == 0 or (array.min() >= INT32.min and array.max() <= INT32.max)):
+        array = array.astype(np.int32)
+        dtype = "i4"
+    elif array.dtype == np.float32:
+        dtype = "f4"
+    else:
+        array = array.astype(np.float64)
+        dtype = "f8"
+    encoded = {"dtype": dtype, "bdata": base64.b64encode(np.ascontiguousarray(array).tobytes()).decode("ascii")}
+    if array.ndim > 1:
+        encoded["shape"] = ",".join(str(size) for size in array.shape)
+    return encoded
+
+
+def encode_array(array, typed_arrays, key=None):
+    typed_arrays = typed_arrays and key in TYPED_KEYS
+    if array.dtype == object and array.size and isinstance(array.flat[0], datetime):
+        array = array.astype("datetime64[ms]")
+    if array.dtype.kind == "M":
+        if typed_arrays and key in DATE_AXES:
+            # Milliseconds since the epoch, the axis is declared as a date axis
+            return typed_array(array.astype("datetime64[ms]").astype(np.int64).astype(np.float64))
+        return np.datetime_as_string(array, unit="s").tolist()
+    if array.dtype.kind in "iub":
+        return typed_array(array) if typed_arrays else array.tolist()
+    if array.dtype.kind == "f":
+        if typed_arrays and np.isfinite(array).all():
+            return typed_array(array)
+        # NaN is not valid JSON; plotly reads null as a gap
+        rounded = np.round(array.astype(np.float64), DECIMALS.get(array.dtype, 6)).astype(object)
+        rounded[~np.isfinite(array)] = None
+        return rounded.tolist()
+    return array.tolist()
+
+
+def encode(value, typed_arrays, key=None):
+    ''' Converts the arrays within a trace to JSON types or typed arrays. '''
+    if isinstance(value, np.ndarray):
+        return encode_array(value, typed_arrays, key)
+    if isinstance(value, dict):
+        return {name: encode(item, typed_arrays, name) for name, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode(item, typed_arrays) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def encode_trace(trace, layout, typed_arrays):
+    for key in DATE_AXES:
+        value = trace.get(key)
+        if typed_arrays and isinstance(value, np.ndarray) and (value.dtype.kind == "M" or (
+                value.dtype == object and value.size and isinstance(value.flat[0], datetime))):
+            # Numbers are only read as dates on an axis of type date
+            axis = "{}axis{}".format(key, trace.get(key + "axis", key)[1:])
+            layout.setdefault(axis, {}).setdefault("type", "date")
+    return encode(trace, typed_arrays)
+
+
+def compact_figure(fig, typed_arrays=TYPED_ARRAYS):
+    ''' Returns the figure as a dictionary of JSON types and, optionally, typed arrays. '''
+    figure = fig.to_dict()
+    figure["data"] = [encode_trace(trace, figure["layout"], typed_arrays) for trace in figure["data"]]
+    if "frames" in figure:
+        figure["frames"] = [dict(frame, data=[encode_trace(trace, figure["layout"], typed_arrays)
+                                              for trace in frame.get("data", [])])
+                            for frame in figure["frames"]]
+    return figure
@@ -0,0 +1,93 @@
+''' The events of a filter result in the form the graphs use. Columns are extracted and times converted once, with
+numpy, and the object is shared by every graph that is drawn for the same result. '''
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from graphs.spatial import SpatialIndex
+from storage.aggregates import aggregate_columns
+from storage.rollups import rollup_columns
+
+
+class EventFrame:
+    def __init__(self, columns, aggregate=None, rollup=None, series=None):
+        ''' Aggregate computes the summaries of storage/aggregates.py over the complete filter result, for a grid
+        cell size, and rollup the magnitude series of storage/rollups.py, for a period. Without them they are
+        computed from the loaded columns. Series identifies the filters apart from the viewport; results of the same
+        series may start their fits from each other. '''
+        self.columns = columns
+        self.series = series
+        self.aggregate = aggregate or (lambda cell: aggregate_columns(columns, cell))
+        self.rollup = rollup or (lambda period: rollup_columns(columns["time"], columns["mag"], period))
+        self._aggregates = {}
+        self._rollups = {}
+        self.lon = columns["lon"]
+        self.lat = columns["lat"]
+        self.depth = columns["depth"]
+        self.mag = columns["mag"]
+        # Significance and tsunami flag, MISSING for events loaded from csv files
+        self.sig = columns["sig"]
+        self.tsunami = columns["tsunami"]
+        # Distance to the coast in km, negative on land
+        self.offshore = columns["offshore"]
+        self.epoch_ms = columns["time"]
+        # Naive UTC datetimes, converted in one vectorized step
+        self.time = pd.to_datetime(self.epoch_ms, unit="ms")
+        self._frame = None
+        self._fingerprint = None
+        self._spatial_index = None
+
+    def __len__(self):
+        return len(self.epoch_ms)
+
+    @property
+    def frame(self):
+        ''' A DataFrame of the columns, built on first use. Graphs that add columns should work on a copy. '''
+        if self._frame is None:
+            self._frame = pd.DataFrame({
+                "long": self.lon,
+                "lat": self.lat,
+                "depth": self.depth,
+                "mag": self.mag,
+                # Events without a significance are drawn at the smallest size
+                "sig": np.maximum(self.sig, 0),
+                "time": self.time,
+            })
+        return self._frame
+
+    def fingerprint(self):
+        ''' A digest of the events, identical for equal filter results. '''
+        if self._fingerprint is None:
+            digest = hashlib.blake2b(digest_size=16)
+            for column in [self.epoch_ms, self.lon, self.lat, self.mag]:
+                digest.update(np.ascontiguousarray(column).tobytes())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def aggregates(self, cell):
+        ''' Returns the magnitude and depth histograms and the density grid, computed once per cell size. '''
+        if cell not in self._aggregates:
+            self._aggregates[cell] = self.aggregate(cell)
+        return self._aggregates[cell]
+
+    def rollups(self, period):
+        ''' Returns the event count, mean and largest magnitude per block of the period, computed once. '''
+        if period not in self._rollups:
+            self._rollups[period] = self.rollup(period)
+        return self._rollups[period]
+
+    def spatial_index(self):
+        ''' The ball tree of the events, built on first use and shared by all proximity analyses. '''
+        if self._spatial_index is None:
+            self._spatial_index = SpatialIndex(self.lon, self.lat)
+        return self._spatial_index
+
+    def subset(self, indices):
+        ''' Returns the selected events as a new EventFrame, whose summaries cover only those events. '''
+        return EventFrame({name: column[indices] for name, column in self.columns.items()})
+
+    def coordinates(self):
+        ''' Returns an (n, 2) array of longitude and latitude. '''
+        return np.column_stack([self.lon, self.lat]).astype(np.float64)
@@ -1,46 +1,47 @@
-import pandas as pd
+import numpy as np
 import plotly.express as px
-from datetime import datetime as dt
 
-def general_graph(data, option, min_mag, n_clusters, colorscale, location):
+from graphs.lod import decimate, density_cell, sample
+from storage.columns import MISSING
 
-    lon = [item['geometry']['coordinates'][0] for item in data]
-    lat = [item['geometry']['coordinates'][1] for item in data]
-    time = [dt.fromtimestamp(item['properties']['time']/1000) for item in data]
-    mag = [item['properties']['mag'] for item in data]
-    place = [item['properties']['place'] for item in data]
-    sig = [item['properties']['sig'] for item in data]
-    depth = [item['geometry']['coordinates'][2] for item in data]
+def general_graph(events, option, min_mag, n_clusters, colorscale, location, zoom):
+    df = events.frame
 
     if option is None:
         return {}
     if option == 'Scatter':
-        
+        indices, counts = decimate(events, zoom)
 
-        fig = px.scatter_mapbox(data, lat=lat, lon=lon, color=mag, range_color=[2.5, 10],
-        size=sig, hover_name=time,
+        fig = px.scatter_mapbox(df.iloc[indices].assign(count=counts), lat='lat', lon='long', color='mag',
+        range_color=[2.5, 10],
+        size='sig', hover_name='time', hover_data=['count'],
         color_continuous_scale=colorscale, size_max=10, zoom=0.6, opacity=0.6,
         title="Earthquake occurances across the world",
-        labels={'color': "Magnitude (M)",
+        labels={'mag': "Magnitude (M)",
                                         'lat': "latitude",
-                                        'lon': "longitude",
-                                        'size': 'Significance',
-                                        'hover_data_0': 'depth (km)'})
+                                        'long': "longitude",
+                                        'sig': 'Significance',
+                                        'count': 'events in area',
+                                        'depth': 'depth (km)'})
         
         return fig
 
     if option == 'Densitymap':
 
-        fig = px.density_mapbox(data, lat=lat, lon=lon, radius=5, zoom=0.6,
-                                color_continuous_scale=colorscale)
+        # Counts per grid cell over all matching events instead of the loaded points
+        density = events.aggregates(density_cell(zoom))["density"]
+        fig = px.density_mapbox(lat=density['lat'], lon=density['lon'], z=density['count'], radius=5, zoom=0.6,
+                                color_continuous_scale=colorscale, labels={'z': 'events'})
 
         return fig
 
     if option == 'ParallelCoordinates':
-        fig = px.parallel_coordinates(data, color=mag, color_continuous_scale=colorscale,
-                                      dimensions=[mag, depth, sig],
+        # Every line is drawn, so only a sample of the events with a significance is sent to the browser
+        known = np.flatnonzero(events.sig != MISSING)
+        fig = px.parallel_coordinates(df.iloc[known[sample(len(known))]], color='mag', color_continuous_scale=colorscale,
+                                      dimensions=['mag', 'depth', 'sig'],
                                       color_continuous_midpoint=2)
 
         return fig
     
-    return {}
\ No newline at end of file
+    return {}
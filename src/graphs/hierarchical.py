@@ -0,0 +1,69 @@
+''' Agglomerative clustering that scales past a few thousand events. Events are placed on the unit sphere, where the
+straight-line distance grows with the great-circle distance, so clusters are not cut at the antimeridian. Depending
+on the number of events and the memory budget, the full linkage, a linkage constrained to a sparse nearest neighbour
+graph, or a linkage of a sample whose clusters are extended to the other events is used. '''
+
+import numpy as np
+from sklearn.cluster import AgglomerativeClustering
+from sklearn.neighbors import NearestNeighbors, kneighbors_graph
+
+# Memory that the linkage may use, in bytes
+MEMORY_BUDGET = 512 * 1024 ** 2
+
+# Number of neighbours every event is connected to in the constrained linkage
+N_NEIGHBORS = 10
+
+# Beyond this size the constrained linkage is faster than the full one
+MAX_FULL = 5000
+
+# The constrained linkage takes a few seconds at this size; larger selections are clustered through a sample
+MAX_CONSTRAINED = 20000
+SAMPLE_SIZE = 10000
+
+
+def to_sphere(lon, lat):
+    ''' Returns the (n, 3) unit vectors of the coordinates in degrees. '''
+    lon, lat = np.radians(lon), np.radians(lat)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def full_linkage_memory(n):
+    # The unconstrained linkage keeps the condensed distance matrix and works on a copy of it
+    return 2 * 8 * n * (n - 1) / 2
+
+
+def strategy(n, memory_budget=MEMORY_BUDGET):
+    if full_linkage_memory(n) <= memory_budget and n <= MAX_FULL:
+        return "full"
+    if n <= MAX_CONSTRAINED:
+        return "constrained"
+    return "sample"
+
+
+def linkage(points, n_clusters, constrained):
+    connectivity = None
+    if constrained:
+        connectivity = kneighbors_graph(points, n_neighbors=min(N_NEIGHBORS, len(points) - 1), include_self=False)
+    return AgglomerativeClustering(n_clusters=n_clusters, connectivity=connectivity).fit(points).labels_
+
+
+def agglomerative(lon, lat, n_clusters, memory_budget=MEMORY_BUDGET, seed=0):
+    ''' Returns a cluster label for every event. '''
+    points = to_sphere(lon, lat)
+    # The linkage needs at least two events, a single event is a cluster of its own
+    if len(points) < 2:
+        return np.zeros(len(points), dtype=np.int64)
+
+    n_clusters = min(n_clusters, len(points))
+    chosen = strategy(len(points), memory_budget)
+
+    if chosen == "full":
+        return linkage(points, n_clusters, constrained=False)
+    if chosen == "constrained":
+        return linkage(points, n_clusters, constrained=True)
+
+    # Cluster a random sample and give every other event the cluster of its nearest sampled event
+    sample = np.random.RandomState(seed).choice(len(points), SAMPLE_SIZE, replace=False)
+    sample_labels = linkage(points[sample], n_clusters, constrained=True)
+    nearest = NearestNeighbors(n_neighbors=1).fit(points[sample]).kneighbors(points, return_distance=False)
+    return sample_labels[nearest[:, 0]]
@@ -0,0 +1,56 @@
+''' Level of detail for scatter maps. Events are binned in a grid whose cells cover a few pixels at the zoom of the
+map; per cell only the strongest event is drawn, together with the number of events it stands for. '''
+
+import numpy as np
+
+# Width of a grid cell in pixels; mapbox renders the world 512 pixels wide at zoom 0
+CELL_PIXELS = 8
+WORLD_PIXELS = 512
+
+# Upper bound on the number of points drawn
+MAX_POINTS = 5000
+
+# Width of the cells in which events are counted for density maps
+DENSITY_PIXELS = 2
+
+
+def cell_size(zoom, pixels=CELL_PIXELS):
+    return 360.0 * pixels / (WORLD_PIXELS * 2 ** max(zoom or 0, 0))
+
+
+def density_cell(zoom):
+    # Whole zoom levels only, so that nearby views share their aggregates
+    return cell_size(int(zoom or 0), DENSITY_PIXELS)
+
+
+def decimate(events, zoom, by=None, max_points=MAX_POINTS):
+    ''' Returns the indices of the events to draw and the number of events in their cells. Events with a different
+    value in by, e.g. the frame of an animation, never share a cell. '''
+    if len(events) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    size = cell_size(zoom)
+    column = np.floor((events.lon.astype(np.float64) + 180) / size).astype(np.int64)
+    row = np.floor((events.lat.astype(np.float64) + 90) / size).astype(np.int64)
+    cell = row * (int(360 / size) + 1) + column
+    if by is not None:
+        cell = cell + np.unique(by, return_inverse=True)[1].astype(np.int64) * (cell.max() + 1)
+
+    # Sort by cell and by descending magnitude and significance, the first event of every cell is kept
+    order = np.lexsort((-events.sig, -events.mag, cell))
+    cells, first, counts = np.unique(cell[order], return_index=True, return_counts=True)
+    indices = order[first]
+
+    if len(indices) > max_points:
+        strongest = np.argsort(-events.mag[indices], kind="mergesort")[:max_points]
+        indices, counts = indices[strongest], counts[strongest]
+    return indices, counts
+
+
+def sample(count, max_points=MAX_POINTS, seed=0):
+    ''' Returns the sorted indices of a random sample of at most max_points of count events. Views that show
+    distributions rather than places draw a sample, which keeps the share of weak and strong events. The seed is fixed
+    so that the same events give the same figure. '''
+    if count <= max_points:
+        return np.arange(count)
+    return np.sort(np.random.RandomState(seed).choice(count, max_points, replace=False))
@@ -0,0 +1,112 @@
+''' Magnitude predictors for the Prediction tab. A predictor maps windows of the last N_STEPS values of a series to the
+next value, for all windows at once. The predictor is created on first use and then shared by every request of the
+process. The default is an autoregressive model in numpy; the LSTM model needs TensorFlow, which is not needed
+otherwise. '''
+
+import hashlib
+import os
+import threading
+from abc import ABC, abstractmethod
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+from storage.cache import LRUCache
+
+# Length of the input windows; 42 blocks of 4 hours cover a week
+N_STEPS = 42
+
+# Regularization of the autoregressive least squares fit
+RIDGE = 1e-3
+
+# "autoregressive" (default) or "lstm", with the path of the trained Keras model
+PREDICTOR = os.environ.get("EARTHQUAKE_PREDICTOR", "autoregressive")
+MODEL_PATH = os.environ.get("EARTHQUAKE_MODEL", "graphs/LSTM_Mag2.h5")
+
+_predictor = None
+_predictor_lock = threading.Lock()
+
+# Fitted models per series, so that rendering the same series again, e.g. with another colour scale, does not refit
+model_cache = LRUCache(max_entries=16)
+
+
+def sliding_windows(series, n_steps):
+    ''' Returns a read-only (n - n_steps + 1, n_steps) view of all windows of the series, without copying it. '''
+    series = np.ascontiguousarray(series, dtype=np.float64)
+    count = max(len(series) - n_steps + 1, 0)
+    stride = series.strides[0]
+    return as_strided(series, shape=(count, n_steps), strides=(stride, stride), writeable=False)
+
+
+class Predictor(ABC):
+    n_steps = N_STEPS
+
+    def fit(self, series):
+        ''' Returns the predictor to use for the series; pretrained models return themselves. '''
+        return self
+
+    @abstractmethod
+    def predict(self, windows):
+        ''' Returns the next value after each of the (m, n_steps) windows. '''
+
+
+class AutoregressivePredictor(Predictor):
+    ''' Linear autoregression fitted on the series itself by ridge regularized least squares. '''
+
+    def __init__(self, coefficients=None):
+        self.coefficients = coefficients
+
+    def fit(self, series):
+        windows = sliding_windows(series, self.n_steps)[:-1]
+        if len(windows) == 0:
+            # Too short to fit, the prediction is the mean of the window
+            return AutoregressivePredictor(np.r_[np.full(self.n_steps, 1.0 / self.n_steps), 0.0])
+
+        design = np.column_stack([windows, np.ones(len(windows))])
+        target = np.asarray(series, dtype=np.float64)[self.n_steps:]
+        gram = design.T @ design + RIDGE * len(windows) * np.eye(design.shape[1])
+        return AutoregressivePredictor(np.linalg.solve(gram, design.T @ target))
+
+    def predict(self, windows):
+        return windows @ self.coefficients[:-1] + self.coefficients[-1]
+
+
+class KerasPredictor(Predictor):
+    ''' A trained Keras model with input shape (n_steps, 1). '''
+
+    def __init__(self, path):
+        try:
+            from tensorflow.keras.models import load_model
+        except ImportError:
+            raise ImportError("The LSTM predictor requires TensorFlow, install it with: pip install tensorflow")
+        self.model = load_model(path)
+
+    def predict(self, windows):
+        windows = np.asarray(windows, dtype=np.float32)[..., np.newaxis]
+        return self.model.predict(windows, batch_size=max(len(windows), 1)).ravel()
+
+
+def get_predictor():
+    ''' Returns the predictor of the process, loading it on first use. '''
+    global _predictor
+    with _predictor_lock:
+        if _predictor is None:
+            _predictor = KerasPredictor(MODEL_PATH) if PREDICTOR == "lstm" else AutoregressivePredictor()
+        return _predictor
+
+
+def fitted(predictor, series):
+    ''' Returns the predictor fitted on the series, reusing the fit of an equal series. '''
+    series = np.ascontiguousarray(series, dtype=np.float64)
+    key = (id(predictor), hashlib.blake2b(series.tobytes(), digest_size=16).hexdigest())
+    return model_cache.get_or_compute(key, lambda: predictor.fit(series))
+
+
+def forecast(model, window, horizon):
+    ''' Predicts horizon values after the window, feeding every prediction back as input. '''
+    n_steps = len(window)
+    values = np.empty(n_steps + horizon)
+    values[:n_steps] = window
+    for step in range(horizon):
+        values[n_steps + step] = model.predict(values[np.newaxis, step:step + n_steps])[0]
+    return values[n_steps:]
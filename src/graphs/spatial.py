@@ -0,0 +1,73 @@
+''' Spatial index of the events of a filter result. The ball tree and the radius neighbourhood graphs are built once
+and shared by every analysis of the same events, e.g. DBSCAN with different parameters and the declustering. '''
+
+import threading
+
+import numpy as np
+from joblib import Parallel, delayed
+from scipy import sparse
+from scipy.spatial import cKDTree
+from sklearn.neighbors import BallTree
+
+from graphs.hierarchical import to_sphere
+
+EARTH_RADIUS_KM = 6371.0
+
+# Neighbourhood graphs are built for at least this radius, so that smaller radii reuse the same graph
+GRAPH_RADIUS_KM = 100.0
+
+# Number of events per parallel neighbour query
+CHUNK_SIZE = 5000
+
+
+class SpatialIndex:
+    def __init__(self, lon, lat, n_jobs=-1):
+        # The haversine metric expects latitude first, in radians
+        self.points = np.radians(np.column_stack([lat, lon]).astype(np.float64))
+        self.tree = BallTree(self.points, metric="haversine")
+        self.lon, self.lat = lon, lat
+        self._sphere_tree = None
+        self.n_jobs = n_jobs
+        self.graphs = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.points)
+
+    def query_radius(self, points, radius_km, return_distance=False):
+        ''' Returns the neighbours within the radius of points given as [lat, lon] radians. '''
+        return self.tree.query_radius(points, r=radius_km / EARTH_RADIUS_KM, return_distance=return_distance,
+                                      sort_results=return_distance)
+
+    def within(self, indices, radius_km):
+        ''' Returns the neighbours of the given events, each within its own radius. The query runs on a k-d tree of
+        unit vectors, where great-circle radii become chord lengths, which is several times faster than the haversine
+        ball tree for many small radii. '''
+        with self.lock:
+            if self._sphere_tree is None:
+                self._sphere_tree = cKDTree(to_sphere(self.lon, self.lat))
+        chord = 2 * np.sin(np.asarray(radius_km, dtype=np.float64) / EARTH_RADIUS_KM / 2)
+        return self._sphere_tree.query_ball_point(self._sphere_tree.data[indices], chord)
+
+    def radius_graph(self, radius_km):
+        ''' Returns the sparse matrix of great-circle distances, in radians, between events within the radius. The
+        rows are sorted by distance, as the clustering estimators expect of a precomputed graph. '''
+        key = max(radius_km, GRAPH_RADIUS_KM)
+        with self.lock:
+            if key not in self.graphs:
+                self.graphs[key] = self._build_graph(key)
+            return self.graphs[key]
+
+    def _build_graph(self, radius_km):
+        n = len(self.points)
+        chunks = [self.points[start:start + CHUNK_SIZE] for start in range(0, n, CHUNK_SIZE)]
+        results = Parallel(n_jobs=self.n_jobs, prefer="threads")(
+            delayed(self.query_radius)(chunk, radius_km, True) for chunk in chunks)
+
+        indices = [row for chunk_indices, _ in results for row in chunk_indices]
+        distances = [row for _, chunk_distances in results for row in chunk_distances]
+        lengths = np.array([len(row) for row in indices], dtype=np.int64)
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+        return sparse.csr_matrix((np.concatenate(distances) if n else np.empty(0),
+                                  np.concatenate(indices) if n else np.empty(0, dtype=np.int64), indptr),
+                                 shape=(n, n))
@@ -1,37 +1,40 @@
 import plotly.graph_objects as go
-from datetime import datetime as dt
 import plotly.express as px
+import pandas as pd
 
-def time_graph(data, option, min_mag, n_clusters, colorscale, location):
-    lon = [item['geometry']['coordinates'][0] for item in data]
-    lat = [item['geometry']['coordinates'][1] for item in data]
-    size = [item['properties']['sig'] for item in data]
-    time = [dt.fromtimestamp(item['properties']['time']/1000) for item in data]
-    mag = [item['properties']['mag'] for item in data]
-    place = [item['properties']['place'] for item in data]
-    days = [str(time[i].day) + "-" + str(time[i].month) for i in range(len(time))]
+from graphs.animation import animated_scatter
 
+def time_graph(events, option, min_mag, n_clusters, colorscale, location, zoom):
     if option is None:
         return {}
 
     if option == 'Scatter-time':
-        fig = px.scatter_mapbox(data, lat=lat, lon=lon, color=mag, range_color=[2.5, 10],
-        size=size, hover_name=time,
-        color_continuous_scale='viridis', size_max=10, zoom=1, opacity=0.6,
-        animation_frame=days)
-        
-        return fig
+        if len(events) == 0:
+            return {}
+
+        def draw(indices, counts):
+            df = events.frame.iloc[indices].assign(count=counts)
+            fig = px.scatter_mapbox(df, lat='lat', lon='long', color='mag', range_color=[2.5, 10],
+            size='sig', hover_name='time', hover_data=['count'],
+            color_continuous_scale='viridis', size_max=10, zoom=1, opacity=0.6)
+            return fig, None
+
+        return animated_scatter(events, zoom, 'time', draw)
 
     if option == 'Magnitude-time':
 
-        time = [item['properties']['time'] for item in data]
-        mag = [item['properties']['mag'] for item in data]
+        # Daily magnitudes from the rollups, which cover long periods without reading the events
+        series = events.rollups("1d")
+        days = pd.to_datetime(series["time"], unit="ms")
 
         # Create figure
         fig = go.Figure()
 
         fig.add_trace(
-            go.Scatter(x=list(time), y=list(mag)))
+            go.Scatter(x=days, y=series["max"], mode="lines", name="Largest magnitude",
+                       customdata=series["count"], hovertemplate="%{y} (%{customdata} events)"))
+        fig.add_trace(
+            go.Scatter(x=days, y=series["mean"], mode="lines", name="Mean magnitude"))
 
         # Set title
         fig.update_layout(
@@ -70,4 +73,4 @@ def time_graph(data, option, min_mag, n_clusters, colorscale, location):
         )
         return fig
 
-    return {}
\ No newline at end of file
+    return {}
@@ -1,2 +1,58 @@
-def tsunami_graph(data, option, min_mag, n_clusters, colorscale, location):
-    return {}
\ No newline at end of file
+import numpy as np
+import plotly.graph_objects as go
+import plotly.express as px
+
+from graphs.lod import decimate
+from storage.columns import MISSING
+
+# Bins of the distance to the coast in km; negative distances lie on land
+OFFSHORE_EDGES = np.array([-500, -200, -100, -50, -25, 0, 25, 50, 100, 200, 500, 1000])
+
+def tsunami_graph(events, option, min_mag, n_clusters, colorscale, location, zoom):
+    if option is None:
+        return {}
+
+    if option == 'Scatter':
+        # Only the events that USGS flagged for a possible tsunami
+        flagged = events.subset(np.flatnonzero(events.tsunami == 1))
+        if len(flagged) == 0:
+            return {}
+
+        indices, counts = decimate(flagged, zoom)
+        df = flagged.frame.assign(offshore=flagged.offshore).iloc[indices].assign(count=counts)
+        fig = px.scatter_mapbox(df, lat='lat', lon='long', color='offshore', size='mag',
+                                hover_name='time', hover_data=['mag', 'depth', 'offshore', 'count'],
+                                color_continuous_scale=colorscale, color_continuous_midpoint=0,
+                                size_max=10, zoom=0.6, opacity=0.7,
+                                title="Events with a tsunami flag",
+                                labels={'lat': "latitude",
+                                        'long': "longitude",
+                                        'mag': 'Magnitude',
+                                        'depth': 'depth (km)',
+                                        'offshore': 'rough distance to coast (km)',
+                                        'count': 'events in area'})
+
+        return fig
+
+    if option == 'Distance':
+        # Share of the events per distance to the coast that carry a tsunami flag; events stored before the
+        # distance was introduced have none until tag_regions.py has run, and events loaded from csv files have no
+        # flag. The distances come from a coarse outline, see ingest/coast.py, so the bins near the coast mix events
+        # on both sides of it
+        known = np.isfinite(events.offshore) & (events.tsunami != MISSING)
+        offshore = np.clip(events.offshore[known], OFFSHORE_EDGES[0], OFFSHORE_EDGES[-1])
+        total = np.histogram(offshore, bins=OFFSHORE_EDGES)[0]
+        flagged = np.histogram(offshore[events.tsunami[known] == 1], bins=OFFSHORE_EDGES)[0]
+        labels = ["{} to {}".format(low, high) for low, high in zip(OFFSHORE_EDGES[:-1], OFFSHORE_EDGES[1:])]
+
+        fig = go.Figure()
+        fig.add_trace(go.Bar(x=labels, y=flagged / np.maximum(total, 1), customdata=np.column_stack([flagged, total]),
+                             hovertemplate="%{customdata[0]} of %{customdata[1]} events<extra></extra>",
+                             marker_color='#3e4989'))
+        fig.update_layout(title="Events with a tsunami flag by distance to the coast",
+                          xaxis_title='Rough distance to the coast (km), negative on land',
+                          yaxis_title='Share of events', yaxis_tickformat='%')
+
+        return fig
+
+    return {}
@@ -0,0 +1,36 @@
+''' Reads the visible area of a map from the relayoutData of its graph. '''
+
+# Views wider than this are treated as global and not restricted to the viewport
+MAX_SPAN = 180
+
+
+def map_view(relayout):
+    ''' Returns the mapbox entries of the relayoutData of a graph, or None when the graph does not show a map. '''
+    view = {name: value for name, value in (relayout or {}).items() if name.startswith("mapbox.")}
+    return view or None
+
+
+def viewport(relayout):
+    ''' Returns the bounds [west, south, east, north] and zoom of the map view, or (None, None) for a global view.
+    West is larger than east when the view crosses the antimeridian. Versions of plotly that only report the center
+    of the view give no bounds, as the size of the graph on screen is not known. '''
+    if not relayout or "mapbox.zoom" not in relayout:
+        return None, None
+
+    zoom = relayout["mapbox.zoom"]
+    derived = relayout.get("mapbox._derived")
+    if derived is None:
+        return None, zoom
+
+    # The corners are ordered top left, top right, bottom right, bottom left
+    corners = derived["coordinates"]
+    lats = [corner[1] for corner in corners]
+    west, east = corners[0][0], corners[1][0]
+    south, north = min(lats), max(lats)
+    span = east - west if east > west else east - west + 360
+    if span >= MAX_SPAN:
+        return None, zoom
+
+    wrap = lambda lon: (lon + 180) % 360 - 180
+    bounds = [wrap(west), max(south, -90), wrap(east), min(north, 90)]
+    return [round(value, 3) for value in bounds], zoom
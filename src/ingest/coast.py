@@ -0,0 +1,94 @@
+''' Rough distance of events to the coast in kilometres, positive at sea and negative on land. The land masses of
+resources/coastline.json are a hand-drawn outline in the format of the regions: the edges of the continents are
+mostly 200 to 350 km long and up to 700 km, and many islands are triangles or quadrilaterals. Where such an edge
+cuts off a bay or a cape the distance is off by up to a few hundred kilometres, so it only tells events far out at sea
+from events near or on the coast. A real coastline in the same format, e.g. Natural Earth at 1:110m, can replace it.
+The edges are sampled every SPACING_KM into a k-d tree that is built once per process, so a batch of events is
+measured with one nearest neighbour query. '''
+
+import os
+import threading
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from ingest.regions import contains, load_regions
+
+COASTLINE_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "resources", "coastline.json")
+
+EARTH_RADIUS_KM = 6371.0
+
+# Distance between the sampled points of the coastline
+SPACING_KM = 10.0
+
+# Land masses that reach the antimeridian or the south pole are closed along it and along this latitude; these edges
+# are not coast
+SOUTHERN_EDGE = -84.0
+
+_coastline = None
+_coastline_lock = threading.Lock()
+
+
+def unit_vectors(lon, lat):
+    lon, lat = np.radians(lon), np.radians(lat)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def sample_edges(polygon, spacing_km=SPACING_KM):
+    ''' Returns points along the coastal edges of the polygon, at most spacing_km apart. '''
+    start, end = polygon, np.roll(polygon, -1, axis=0)
+    closure = ((np.abs(start[:, 0]) == 180) & (np.abs(end[:, 0]) == 180)) | \
+              ((start[:, 1] <= SOUTHERN_EDGE) & (end[:, 1] <= SOUTHERN_EDGE))
+    start, end = start[~closure], end[~closure]
+    chord = np.linalg.norm(unit_vectors(end[:, 0], end[:, 1]) - unit_vectors(start[:, 0], start[:, 1]), axis=1)
+    steps = np.maximum(np.ceil(chord * EARTH_RADIUS_KM / spacing_km), 1).astype(np.int64)
+    edge = np.repeat(np.arange(len(start)), steps)
+    fraction = (np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)) / np.repeat(steps, steps)
+    return start[edge] + (end[edge] - start[edge]) * fraction[:, np.newaxis]
+
+
+class Coastline:
+    def __init__(self, land):
+        self.land = land
+        points = np.concatenate([sample_edges(polygon) for polygon in land.values()])
+        self.tree = cKDTree(unit_vectors(points[:, 0], points[:, 1]))
+
+    def on_land(self, lon, lat):
+        inside = np.zeros(len(lon), dtype=bool)
+        for polygon in self.land.values():
+            # Only the points within the bounding box of a land mass are tested against its edges
+            (west, south), (east, north) = polygon.min(axis=0), polygon.max(axis=0)
+            candidates = np.flatnonzero((lon >= west) & (lon <= east) & (lat >= south) & (lat <= north))
+            inside[candidates] |= contains(polygon, lon[candidates], lat[candidates])
+        return inside
+
+    def offshore_km(self, lon, lat):
+        ''' Returns the signed distance of every point to the nearest point of the coastline. '''
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        if len(lon) == 0:
+            return np.empty(0)
+
+        chord = self.tree.query(unit_vectors(lon, lat))[0]
+        distance = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chord / 2, 1))
+        return np.where(self.on_land(lon, lat), -distance, distance)
+
+
+def get_coastline():
+    ''' Returns the coastline of the process, building its index on first use. '''
+    global _coastline
+    with _coastline_lock:
+        if _coastline is None:
+            _coastline = Coastline(load_regions(COASTLINE_PATH))
+        return _coastline
+
+
+def tag_offshore(events):
+    ''' Stores the offshore distance on a batch of GeoJSON features. '''
+    if not events:
+        return events
+    coordinates = np.array([event["geometry"]["coordinates"][:2] for event in events], dtype=np.float64)
+    distances = get_coastline().offshore_km(coordinates[:, 0], coordinates[:, 1])
+    for event, distance in zip(events, distances):
+        event["offshore_km"] = round(float(distance), 1)
+    return events
@@ -0,0 +1,59 @@
+''' Normalises events into the document shape that is stored in mongodb and queried by the app: the GeoJSON features
+of the FDSN service. '''
+
+from datetime import datetime, timezone
+
+
+def _float(value):
+    return float(value) if value not in (None, "") else None
+
+
+def _int(value):
+    return int(value) if value not in (None, "") else None
+
+
+def _epoch_ms(value):
+    ''' Converts an ISO 8601 timestamp as used in the USGS csv files to milliseconds since the epoch. '''
+    if not value:
+        return None
+    value = value.rstrip("Z")
+    text_format = "%Y-%m-%dT%H:%M:%S.%f" if "." in value else "%Y-%m-%dT%H:%M:%S"
+    moment = datetime.strptime(value, text_format).replace(tzinfo=timezone.utc)
+    return int(round(moment.timestamp() * 1000))
+
+
+def csv_row_to_feature(row):
+    ''' Converts a row of a USGS csv catalog to a GeoJSON feature. The csv format has no tsunami flag and no
+    significance, they are left empty rather than guessed. '''
+    return {
+        "type": "Feature",
+        "id": row["id"],
+        "properties": {
+            "mag": _float(row.get("mag")),
+            "place": row.get("place"),
+            "time": _epoch_ms(row.get("time")),
+            "updated": _epoch_ms(row.get("updated")),
+            "status": row.get("status"),
+            "tsunami": None,
+            "sig": None,
+            "net": row.get("net"),
+            "nst": _int(row.get("nst")),
+            "dmin": _float(row.get("dmin")),
+            "rms": _float(row.get("rms")),
+            "gap": _float(row.get("gap")),
+            "magType": row.get("magType"),
+            "type": row.get("type"),
+        },
+        "geometry": {
+            "type": "Point",
+            "coordinates": [_float(row.get("longitude")), _float(row.get("latitude")), _float(row.get("depth"))],
+        },
+    }
+
+
+def is_complete(feature):
+    ''' An event can only be shown when it has a magnitude and all three coordinates. '''
+    geometry = feature.get("geometry") or {}
+    coordinates = geometry.get("coordinates")
+    return (feature["properties"].get("mag") is not None
+            and coordinates is not None and len(coordinates) >= 3 and None not in coordinates[:3])
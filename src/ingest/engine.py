@@ -0,0 +1,170 @@
+''' Concurrent ingestion of USGS events into mongodb. The requested period is cut into yearly windows, which the
+planner splits until each part fits in one query. The parts are fetched by a pool of workers; the time spans of
+finished windows are recorded, so an interrupted run resumes where it stopped, even when the catalog changed and the
+planner cuts the remaining time differently.
+Once the backfill is complete, later runs only ask for the events that changed since the previous sync. '''
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from ingest.fdsn import DATE_FORMAT, MAX_LIMIT
+from ingest.planner import Window, plan
+from ingest.store import store_events
+from ingest.stream import batches
+
+# Number of events written to mongodb at once; this bounds the memory used per worker
+BATCH_SIZE = 1000
+
+# Every run cuts the timeline at the same boundaries, so checkpoints of earlier runs stay valid
+EPOCH = datetime(2000, 1, 1)
+
+
+def make_windows(start=EPOCH, end=None):
+    ''' Returns the calendar years between start and end. '''
+    end = end or datetime.utcnow()
+    windows = []
+    for year in range(max(start.year, EPOCH.year), end.year + 1):
+        if datetime(year, 1, 1) < end:
+            windows.append(Window(datetime(year, 1, 1), min(datetime(year + 1, 1, 1), end)))
+    return windows
+
+
+def window_key(window):
+    return window.start.isoformat() + "/" + window.end.isoformat()
+
+
+def uncovered(window, spans):
+    ''' Returns the parts of the window that none of the spans cover. '''
+    gaps = []
+    start = window.start
+    for span in sorted(spans):
+        if span.end <= start or span.start >= window.end:
+            continue
+        if span.start > start:
+            gaps.append(Window(start, span.start))
+        start = max(start, span.end)
+    if start < window.end:
+        gaps.append(Window(start, window.end))
+    return gaps
+
+
+class Checkpoint:
+    ''' Keeps track of the time spans that have been stored completely. '''
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def spans(self):
+        spans = []
+        for item in self.collection.find({}, {"_id": True}):
+            start, end = item["_id"].split("/")
+            spans.append(Window(datetime.fromisoformat(start), datetime.fromisoformat(end)))
+        return spans
+
+    def mark(self, window, count):
+        # A window that reaches into the future can still receive new events, so it is never final
+        if window.end >= datetime.utcnow():
+            return
+        self.collection.replace_one(
+            {"_id": window_key(window)},
+            {"_id": window_key(window), "count": count, "finished": datetime.utcnow()},
+            upsert=True)
+
+
+def iter_window(client, window, limit=MAX_LIMIT, **params):
+    ''' Yields all events of a window while they arrive, in pages of at most limit events. '''
+    offset = 1
+    while True:
+        page = 0
+        for feature in client.stream(window.start, window.end, offset=offset, limit=limit, **params):
+            page += 1
+            yield feature
+
+        # Only windows the planner could not split any further need more than one page
+        if page < limit:
+            return
+        offset += limit
+
+
+def fetch_window(client, collection, window, limit=MAX_LIMIT, **params):
+    ''' Retrieves all events of a window and stores them in batches as they arrive. Returns the number of events. '''
+    count = 0
+    for events in batches(iter_window(client, window, limit, **params), BATCH_SIZE):
+        count += store_events(collection, events)
+    return count
+
+
+def plan_windows(pool, client, windows, **params):
+    ''' Plans the windows concurrently. Returns a dict from window to its parts; failed windows are left out. '''
+    futures = {pool.submit(plan, client, window, **params): window for window in windows}
+    plans = {}
+    for future in as_completed(futures):
+        window = futures[future]
+        try:
+            plans[window] = future.result()
+        except Exception as error:
+            print("Failed to plan", window_key(window) + ":", error)
+    return plans
+
+
+def run(client, collection, checkpoint, windows, workers=8, **params):
+    # Only the time that no finished window covers is planned again
+    spans = checkpoint.spans()
+    gaps = {gap: window for window in windows for gap in uncovered(window, spans)}
+    pending = set(gaps.values())
+
+    started = time.time()
+    total = 0
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        plans = plan_windows(pool, client, list(gaps), **params)
+        failed += len(gaps) - len(plans)
+        unplanned = set(gaps[gap] for gap in gaps if gap not in plans)
+
+        parts = [(gaps[gap], part) for gap in plans for part, count in plans[gap]]
+        remaining = {window: sum(1 for parent, _ in parts if parent == window) for window in pending}
+        counts = {window: sum(count for gap in plans if gaps[gap] == window for _, count in plans[gap])
+                  for window in pending}
+        print("Retrieving", len(parts), "windows of", len(pending), "years with", workers, "workers")
+
+        futures = {pool.submit(fetch_window, client, collection, part, **params): (window, part)
+                   for window, part in parts}
+        for future in as_completed(futures):
+            window, part = futures[future]
+            try:
+                count = future.result()
+            except Exception as error:
+                # The window stays unchecked and is retried by the next run
+                print("Failed to retrieve", window_key(part) + ":", error)
+                failed += 1
+                continue
+
+            checkpoint.mark(part, count)
+            total += count
+            print("Stored", count, "earthquakes from", part.start.strftime("%Y-%m-%d %H:%M"),
+                  "to", part.end.strftime("%Y-%m-%d %H:%M"))
+
+            remaining[window] -= 1
+            if remaining[window] == 0 and window not in unplanned:
+                checkpoint.mark(window, counts[window])
+
+    elapsed = time.time() - started
+    print("Stored", total, "earthquakes in", round(elapsed, 1), "seconds")
+    return total, failed
+
+
+def sync(client, collection, since, end=None, workers=8):
+    ''' Retrieves every event that was added, revised or deleted after since. Returns the number of events. '''
+    end = end or datetime.utcnow()
+    params = {"updatedafter": since.strftime(DATE_FORMAT), "includedeleted": "true"}
+
+    count = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        parts = plan(client, Window(EPOCH, end), **params)
+        futures = [pool.submit(fetch_window, client, collection, part, **params) for part, _ in parts]
+        for future in as_completed(futures):
+            count += future.result()
+
+    print("Synchronised", count, "earthquakes updated after", since.strftime("%Y-%m-%d %H:%M:%S"))
+    return count
@@ -0,0 +1,66 @@
+''' Client for the FDSN event web service that USGS exposes. A single pooled session is shared by all workers. '''
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from ingest.stream import iter_features
+
+USGS_URL = "https://earthquake.usgs.gov/fdsnws/event/1"
+
+# The service refuses queries that would return more events than this
+MAX_LIMIT = 20000
+
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+# Size of the chunks in which a response is read while it is being parsed
+CHUNK_SIZE = 64 * 1024
+
+
+class FdsnClient:
+    def __init__(self, base_url=USGS_URL, pool_size=8, timeout=120, retries=3):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+        # Keep one connection per worker alive and retry transient server errors
+        retry = Retry(total=retries, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def params(self, start, end, **extra):
+        params = {
+            "format": "geojson",
+            "orderby": "time-asc",
+            "starttime": start.strftime(DATE_FORMAT),
+            "endtime": end.strftime(DATE_FORMAT),
+        }
+        params.update(extra)
+        return params
+
+    def query(self, start, end, offset=1, limit=MAX_LIMIT, **extra):
+        ''' Returns the features of a single page of the query endpoint. '''
+        params = self.params(start, end, offset=offset, limit=limit, **extra)
+        response = self.session.get(self.base_url + "/query", params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()["features"]
+
+    def stream(self, start, end, offset=1, limit=MAX_LIMIT, **extra):
+        ''' Same as query, but yields the features while the response is being received. '''
+        params = self.params(start, end, offset=offset, limit=limit, **extra)
+        with self.session.get(self.base_url + "/query", params=params, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            for feature in iter_features(response.iter_content(CHUNK_SIZE)):
+                yield feature
+
+    def count(self, start, end, **extra):
+        ''' Returns the number of events the query endpoint would return for the same parameters. '''
+        params = self.params(start, end, **extra)
+        del params["orderby"]
+        response = self.session.get(self.base_url + "/count", params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()["count"]
+
+    def close(self):
+        self.session.close()
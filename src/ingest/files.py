@@ -0,0 +1,46 @@
+''' Reads archived USGS catalog files, either GeoJSON feature collections or csv exports. '''
+
+import csv
+import os
+
+from ingest.documents import csv_row_to_feature, is_complete
+from ingest.fdsn import CHUNK_SIZE
+from ingest.stream import iter_features
+
+EXTENSIONS = (".geojson", ".json", ".csv")
+
+
+def find_files(directory):
+    paths = []
+    for root, _, names in os.walk(directory):
+        paths += [os.path.join(root, name) for name in sorted(names) if name.lower().endswith(EXTENSIONS)]
+    return sorted(paths)
+
+
+def iter_file(path):
+    ''' Yields the features of a catalog file. '''
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as file:
+            for row in csv.DictReader(file):
+                yield csv_row_to_feature(row)
+    else:
+        with open(path, "rb") as file:
+            for feature in iter_features(iter(lambda: file.read(CHUNK_SIZE), b"")):
+                yield feature
+
+
+def read_batches(path, size):
+    ''' Yields the complete features of the file in batches of at most size, each with the number of features that
+    were dropped since the previous batch. Only one batch is held in memory at a time. '''
+    features = []
+    dropped = 0
+    for feature in iter_file(path):
+        if is_complete(feature):
+            features.append(feature)
+        else:
+            dropped += 1
+        if len(features) == size:
+            yield features, dropped
+            features, dropped = [], 0
+    if features or dropped:
+        yield features, dropped
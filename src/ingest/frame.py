@@ -0,0 +1,45 @@
+''' Converts batches of GeoJSON features to typed pandas columns. '''
+
+import numpy as np
+import pandas as pd
+
+from ingest.coast import get_coastline
+
+COLUMNS = ["long", "lat", "depth", "mag", "tsunami", "offshore", "significance", "timestamp"]
+
+
+def features_to_frame(features):
+    ''' Returns a DataFrame with float32 coordinates and magnitudes, a categorical tsunami flag, the distance
+    to the coast, the significance and UTC timestamps. Missing flags and significances are NaN. '''
+    if not features:
+        return empty_frame()
+
+    coordinates = np.array([feature["geometry"]["coordinates"][:3] for feature in features], dtype=np.float32)
+    properties = [feature["properties"] for feature in features]
+    times = np.array([item["time"] for item in properties], dtype=np.int64)
+
+    return pd.DataFrame({
+        "long": coordinates[:, 0],
+        "lat": coordinates[:, 1],
+        "depth": coordinates[:, 2],
+        "mag": np.array([item["mag"] for item in properties], dtype=np.float32),
+        # Events loaded from csv files have no tsunami flag and no significance
+        "tsunami": pd.Categorical([item.get("tsunami") for item in properties], categories=[0, 1]),
+        "offshore": get_coastline().offshore_km(coordinates[:, 0], coordinates[:, 1]).astype(np.float32),
+        "significance": np.array([item.get("sig") for item in properties], dtype=np.float64),
+        # One vectorized conversion for the whole batch instead of formatting every timestamp
+        "timestamp": pd.to_datetime(times, unit="ms", utc=True),
+    }, columns=COLUMNS)
+
+
+def empty_frame():
+    return features_to_frame([{"geometry": {"coordinates": [0, 0, 0]}, "properties": {"time": 0, "mag": 0}}]).iloc[:0]
+
+
+def concat_frames(frames):
+    ''' Concatenates batches and sorts them chronologically, keeping the column types. '''
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return empty_frame()
+    df = pd.concat(frames, ignore_index=True)
+    return df.sort_values("timestamp", kind="mergesort").reset_index(drop=True)
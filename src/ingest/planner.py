@@ -0,0 +1,28 @@
+''' Plans the windows in which events are requested. The count endpoint is asked first and a window is split in halves
+until every part fits in a single query, so quiet periods take one request and busy sequences are cut finely. '''
+
+from collections import namedtuple
+from datetime import timedelta
+
+from ingest.fdsn import MAX_LIMIT
+
+Window = namedtuple("Window", ["start", "end"])
+
+# Windows are not split any further than this; the fetch falls back to paging for such a window
+MIN_SPAN = timedelta(minutes=1)
+
+
+def split(window):
+    half = timedelta(seconds=(window.end - window.start).total_seconds() // 2)
+    middle = window.start + half
+    return Window(window.start, middle), Window(middle, window.end)
+
+
+def plan(client, window, limit=MAX_LIMIT, **params):
+    ''' Returns a list of (window, count) tuples that together cover the window, each holding at most limit events. '''
+    count = client.count(window.start, window.end, **params)
+    if count <= limit or window.end - window.start <= MIN_SPAN:
+        return [(window, count)]
+
+    first, second = split(window)
+    return plan(client, first, limit, **params) + plan(client, second, limit, **params)
@@ -0,0 +1,51 @@
+''' Assigns events to the named regions of resources/regions.json. Each region is a polygon of (longitude, latitude)
+vertices; the tags are stored on the event so that the app can select a region with an indexed equality lookup. '''
+
+import json
+import os
+
+import numpy as np
+
+REGIONS_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "resources", "regions.json")
+
+
+def load_regions(path=REGIONS_PATH):
+    with open(path) as file:
+        return {name: np.array(vertices, dtype=np.float64) for name, vertices in json.load(file).items()}
+
+
+REGIONS = load_regions()
+
+
+def contains(polygon, lon, lat):
+    ''' Returns a boolean array telling which points lie inside the polygon, using ray casting over all edges. '''
+    inside = np.zeros(len(lon), dtype=bool)
+    x1, y1 = polygon[:, 0], polygon[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+    for i in range(len(polygon)):
+        crosses = (y1[i] > lat) != (y2[i] > lat)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x = x1[i] + (lat - y1[i]) * (x2[i] - x1[i]) / (y2[i] - y1[i])
+        inside ^= crosses & (lon < x)
+    return inside
+
+
+def region_tags(lon, lat, regions=REGIONS):
+    ''' Returns for every point the list of regions it lies in. '''
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    tags = [[] for _ in range(len(lon))]
+    for name, polygon in regions.items():
+        for index in np.flatnonzero(contains(polygon, lon, lat)):
+            tags[index].append(name)
+    return tags
+
+
+def tag_events(events):
+    ''' Stores the region tags on a batch of GeoJSON features. '''
+    if not events:
+        return events
+    coordinates = np.array([event["geometry"]["coordinates"][:2] for event in events], dtype=np.float64)
+    for event, tags in zip(events, region_tags(coordinates[:, 0], coordinates[:, 1])):
+        event["regions"] = tags
+    return events
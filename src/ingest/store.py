@@ -0,0 +1,91 @@
+''' Writes USGS features to mongodb. Events are keyed on their USGS id, so storing an event twice replaces it. '''
+
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from ingest.coast import tag_offshore
+from ingest.documents import is_complete
+from ingest.regions import tag_events
+from storage.cube import CUBE_COLLECTION, PROJECTION as CUBE_PROJECTION, ensure_cube_indexes, mark_built, update_cube
+from storage.rollups import ROLLUP_COLLECTION, PROJECTION as ROLLUP_PROJECTION, ensure_rollup_indexes, update_rollups
+
+# Fields of the stored versions of events that are taken out of the cube and the rollups
+PROJECTION = {**CUBE_PROJECTION, **ROLLUP_PROJECTION}
+
+
+def remove_duplicates(collection):
+    ''' Keeps a single copy of every event; earlier versions of the retrieval inserted boundary events twice. '''
+    duplicates = collection.aggregate([
+        {"$group": {"_id": "$id", "copies": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True)
+
+    for duplicate in duplicates:
+        collection.delete_many({"_id": {"$in": duplicate["copies"][1:]}})
+
+
+def ensure_indexes(collection):
+    if "usgs_id" not in collection.index_information():
+        remove_duplicates(collection)
+        collection.create_index([("id", ASCENDING)], unique=True, name="usgs_id")
+    ensure_cube_indexes(collection.database[CUBE_COLLECTION])
+    ensure_rollup_indexes(collection.database[ROLLUP_COLLECTION])
+
+    # The cube and the rollups of an empty database trivially hold every stored event
+    if collection.find_one({}, {"_id": True}) is None:
+        mark_built(collection.database[CUBE_COLLECTION])
+        mark_built(collection.database[ROLLUP_COLLECTION])
+
+
+def replace_event(collection, event_id, event=None):
+    ''' Replaces the stored version of an event, or removes it when no event is given. Returns the version that was
+    replaced, as it was at the moment of the write. '''
+    if event is None:
+        return collection.find_one_and_delete({"id": event_id}, PROJECTION)
+    try:
+        return collection.find_one_and_replace({"id": event_id}, event, PROJECTION, upsert=True,
+                                               return_document=ReturnDocument.BEFORE)
+    except DuplicateKeyError:
+        # Two upserts of a new event raced, the second one replaces the version of the first
+        return collection.find_one_and_replace({"id": event_id}, event, PROJECTION,
+                                               return_document=ReturnDocument.BEFORE)
+
+
+def store_events(collection, events):
+    ''' Upserts the events and removes the ones USGS marked as deleted. Events without a magnitude or location are
+    removed as well, as the app cannot show them. Events are tagged with their regions and offshore distance. The cube
+    and the rollups are updated with the difference. Returns the number of events. '''
+    if not events:
+        return 0
+
+    # A batch can hold an event twice when it lies on the boundary of two pages, only the last version counts
+    unique = list({event["id"]: event for event in events}.values())
+
+    shown = lambda event: event["properties"].get("status") != "deleted" and is_complete(event)
+    complete = [event for event in unique if shown(event)]
+    removed = [event["id"] for event in unique if not shown(event)]
+
+    # Every event is swapped on its own, and the cube and the rollups take out the version the swap returned. When
+    # the same event is stored concurrently or again after a failure, each version is taken out exactly once.
+    previous = [replace_event(collection, event["id"], event) for event in tag_offshore(tag_events(complete))]
+    previous += [replace_event(collection, event_id) for event_id in removed]
+    previous = [event for event in previous if event is not None and is_complete(event)]
+
+    update_cube(collection.database[CUBE_COLLECTION], previous, complete)
+    update_rollups(collection.database[ROLLUP_COLLECTION], collection, previous, complete)
+    return len(events)
+
+
+class SyncState:
+    ''' Remembers when the collection was last brought up to date with the service. '''
+
+    def __init__(self, collection, name="earthquakes"):
+        self.collection = collection
+        self.name = name
+
+    def last_sync(self):
+        state = self.collection.find_one({"_id": self.name})
+        return state["synced"] if state is not None else None
+
+    def update(self, synced):
+        self.collection.replace_one({"_id": self.name}, {"_id": self.name, "synced": synced}, upsert=True)
@@ -0,0 +1,94 @@
+''' Incremental parsing of GeoJSON feature collections. Features are yielded one by one while the response is still
+being read, so only a single feature and one chunk of text are held in memory at a time. '''
+
+import codecs
+import json
+from itertools import islice
+
+WHITESPACE = " \t\n\r"
+
+
+class _Reader:
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.json = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        ''' Appends the next chunk to the buffer. Returns False when the input is exhausted. '''
+        if self.eof:
+            return False
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.eof = True
+            self.buffer += self.decoder.decode(b"", final=True)
+            return False
+
+        # Drop the part that has been consumed already
+        self.buffer = self.buffer[self.pos:] + self.decoder.decode(chunk)
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                raise ValueError("Unexpected end of GeoJSON document")
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError("Expected {} at position {} of GeoJSON document".format(char, self.pos))
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.json.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+
+            # A value that touches the end of the buffer may continue in the next chunk
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_features(chunks):
+    ''' Yields the features of a GeoJSON feature collection that arrives as chunks of bytes. '''
+    reader = _Reader(chunks)
+    reader.expect("{")
+    while reader.peek() != "}":
+        key = reader.value()
+        reader.expect(":")
+        if key != "features":
+            reader.value()
+        else:
+            reader.expect("[")
+            while reader.peek() != "]":
+                yield reader.value()
+                if reader.peek() == ",":
+                    reader.pos += 1
+            reader.pos += 1
+
+        if reader.peek() == ",":
+            reader.pos += 1
+
+
+def batches(iterable, size):
+    ''' Yields lists of at most size items. '''
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
@@ -0,0 +1,72 @@
+''' This module loads archived USGS catalog files (GeoJSON or csv) from a directory into mongodb, so the database can be
+rebuilt without network access. Files are parsed and stored in parallel, in batches, by worker processes; events
+without a magnitude or location are dropped. '''
+
+import argparse
+import time
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import pymongo
+
+from ingest.engine import BATCH_SIZE
+from ingest.files import find_files, read_batches
+from ingest.store import SyncState, ensure_indexes, store_events
+
+# Collection of a worker process, connected when the process starts
+worker_collection = None
+
+
+def connect(uri):
+    global worker_collection
+    worker_collection = pymongo.MongoClient(uri)["map-earthquake-data"]["earthquakes"]
+
+
+def load_file(path):
+    ''' Stores the events of a file batch by batch. Returns the path and the number of stored and dropped events. '''
+    stored = 0
+    dropped = 0
+    for features, incomplete in read_batches(path, BATCH_SIZE):
+        stored += store_events(worker_collection, features)
+        dropped += incomplete
+    return path, stored, dropped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load USGS catalog files into mongodb.")
+    parser.add_argument("directory", help="directory containing .geojson, .json or .csv catalog files")
+    parser.add_argument("--processes", type=int, default=None, help="number of loading processes")
+    parser.add_argument("--mongo", default="mongodb://localhost:27017/")
+    args = parser.parse_args()
+
+    # Connect to the db
+    mongo = pymongo.MongoClient(args.mongo)
+    db = mongo["map-earthquake-data"]
+    collection = db["earthquakes"]
+    ensure_indexes(collection)
+
+    paths = find_files(args.directory)
+    print("Loading", len(paths), "catalog files")
+
+    started = time.time()
+    total = 0
+    dropped = 0
+    with ProcessPoolExecutor(max_workers=args.processes, initializer=connect, initargs=(args.mongo,)) as pool:
+        for index, (path, stored, incomplete) in enumerate(pool.map(load_file, paths)):
+            total += stored
+            dropped += incomplete
+
+            elapsed = time.time() - started
+            print("[{}/{}] {}: {} events, {} dropped ({:.0f} events/s)".format(
+                index + 1, len(paths), path, stored, incomplete, total / max(elapsed, 1e-9)))
+
+    # Let the app know that the data has changed
+    SyncState(db["sync"], name="catalog-files").update(datetime.utcnow())
+
+    print("Loaded", total, "earthquakes and dropped", dropped, "incomplete ones in",
+          round(time.time() - started, 1), "seconds")
+
+
+# Worker processes import this module again when they are spawned (Windows, macOS), only the parent loads
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+''' Pre-binned summaries of a filter result: magnitude and depth histograms and event counts per grid cell. They are
+computed over every matching event, not only over the events that are loaded for drawing. '''
+
+import numpy as np
+
+# Bins of half a magnitude and 20 km, the steps of the sliders in the sidebar
+MAG_EDGES = np.arange(-2, 10.75, 0.5)
+DEPTH_EDGES = np.arange(-20, 820, 20.0)
+
+
+def histogram(values, edges):
+    return np.histogram(values, bins=edges)[0].astype(np.int64)
+
+
+def grid_counts(lon, lat, cell):
+    ''' Returns the centers of the occupied grid cells and the number of events in each. '''
+    x = np.floor((np.asarray(lon, dtype=np.float64) + 180) / cell).astype(np.int64)
+    y = np.floor((np.asarray(lat, dtype=np.float64) + 90) / cell).astype(np.int64)
+    return cell_centers(x, y, cell)
+
+
+def cell_centers(x, y, cell, counts=None):
+    ''' Merges cell indices into unique cells; counts gives the number of events of every index pair. '''
+    width = int(np.ceil(360 / cell)) + 1
+    cells, inverse = np.unique(np.asarray(y) * width + np.asarray(x), return_inverse=True)
+    totals = np.bincount(inverse, weights=counts, minlength=len(cells)).astype(np.int64)
+    return {
+        "lon": (cells % width + 0.5) * cell - 180,
+        "lat": (cells // width + 0.5) * cell - 90,
+        "count": totals,
+    }
+
+
+def aggregate_columns(columns, cell):
+    ''' Computes the summaries from columns that are already in memory. '''
+    return {
+        "mag": histogram(columns["mag"], MAG_EDGES),
+        "depth": histogram(columns["depth"], DEPTH_EDGES),
+        "density": grid_counts(columns["lon"], columns["lat"], cell),
+    }
@@ -0,0 +1,49 @@
+''' In-process cache with least-recently-used eviction. Entries also expire after a maximum age, or as soon as the
+version of the underlying data changes, e.g. after an ingestion run. '''
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, max_entries=64, max_age=3600, version=None):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.version = version or (lambda: None)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, version=None):
+        ''' Returns the cached value, or None when the key is missing or no longer valid. '''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            value, created, entry_version = entry
+            if time.time() - created > self.max_age or entry_version != version:
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, version=None):
+        with self.lock:
+            self.entries[key] = (value, time.time(), version)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        version = self.version()
+        value = self.get(key, version)
+        if value is None:
+            value = compute()
+            self.put(key, value, version)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
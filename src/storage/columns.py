@@ -0,0 +1,74 @@
+''' The columnar representation of events: one typed numpy array per field the dashboard uses. '''
+
+import numpy as np
+
+FIELDS = {
+    "id": object,
+    "time": np.int64,
+    "mag": np.float32,
+    "lon": np.float32,
+    "lat": np.float32,
+    "depth": np.float32,
+    "sig": np.int32,
+    "tsunami": np.int8,
+    "offshore": np.float32,
+    "place": object,
+    "regions": object,
+}
+
+# Value of the integer fields of events that do not have them, e.g. the tsunami flag and significance of events
+# loaded from csv files
+MISSING = -1
+
+# Projection of the stored GeoJSON documents onto the fields above
+PROJECTION = {
+    "_id": False,
+    "id": True,
+    "geometry.coordinates": True,
+    "properties.time": True,
+    "properties.mag": True,
+    "properties.sig": True,
+    "properties.tsunami": True,
+    "properties.place": True,
+    "regions": True,
+    "offshore_km": True,
+}
+
+
+def empty_columns():
+    return {name: np.empty(0, dtype=dtype) for name, dtype in FIELDS.items()}
+
+
+def object_array(values):
+    # np.array would turn a list of equally long lists into a two-dimensional array
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def missing(value):
+    return MISSING if value is None else value
+
+
+def features_to_columns(features):
+    ''' Converts GeoJSON features to columns. '''
+    if not features:
+        return empty_columns()
+
+    coordinates = np.array([feature["geometry"]["coordinates"][:3] for feature in features], dtype=np.float32)
+    properties = [feature["properties"] for feature in features]
+    return {
+        "id": np.array([feature.get("id") for feature in features], dtype=object),
+        "time": np.array([item["time"] for item in properties], dtype=np.int64),
+        "mag": np.array([item["mag"] for item in properties], dtype=np.float32),
+        "lon": coordinates[:, 0],
+        "lat": coordinates[:, 1],
+        "depth": coordinates[:, 2],
+        "sig": np.array([missing(item.get("sig")) for item in properties], dtype=np.int32),
+        "tsunami": np.array([missing(item.get("tsunami")) for item in properties], dtype=np.int8),
+        # Events stored before the offshore distance was introduced have none
+        "offshore": np.array([feature.get("offshore_km", np.nan) for feature in features], dtype=np.float32),
+        "place": np.array([item.get("place") for item in properties], dtype=object),
+        "regions": object_array([feature.get("regions") or [] for feature in features]),
+    }
+
@@ -0,0 +1,137 @@
+''' Materialized cube of event counts and magnitude sums per day, magnitude bin, depth bin and grid cell. It is kept
+up to date when events are stored and answers the overview histograms and density maps without reading events. '''
+
+import numpy as np
+from pymongo import ASCENDING, UpdateOne
+
+from storage.aggregates import DEPTH_EDGES, MAG_EDGES, cell_centers
+
+CUBE_COLLECTION = "cube"
+DIMENSIONS = ["day", "mag", "depth", "x", "y"]
+
+# Size of the grid cells in degrees
+CUBE_CELL = 2.0
+
+MS_PER_DAY = 24 * 3600 * 1000
+
+# Marker document of a cube or rollup collection that holds every stored event, written by its build script or when
+# the first events are stored into an empty database
+BUILT = {"_id": "built"}
+
+# Fields of the stored events the cube is computed from
+PROJECTION = {"_id": False, "geometry.coordinates": True, "properties.mag": True, "properties.time": True}
+
+
+def bin_index(values, edges):
+    ''' Returns the bin of every value; values outside the edges are put in the first or last bin. '''
+    return np.clip(np.searchsorted(edges, values, side="right") - 1, 0, len(edges) - 2)
+
+
+def cube_cells(features):
+    ''' Returns an array with the cube coordinates of every feature and an array with their magnitudes. '''
+    if not features:
+        return np.empty((0, len(DIMENSIONS)), dtype=np.int64), np.empty(0)
+
+    coordinates = np.array([feature["geometry"]["coordinates"][:3] for feature in features], dtype=np.float64)
+    mag = np.array([feature["properties"]["mag"] for feature in features], dtype=np.float64)
+    time = np.array([feature["properties"]["time"] for feature in features], dtype=np.int64)
+    cells = np.column_stack([
+        time // MS_PER_DAY,
+        bin_index(mag, MAG_EDGES),
+        bin_index(coordinates[:, 2], DEPTH_EDGES),
+        np.floor((coordinates[:, 0] + 180) / CUBE_CELL),
+        np.floor((coordinates[:, 1] + 90) / CUBE_CELL),
+    ]).astype(np.int64)
+    return cells, mag
+
+
+def cube_changes(removed, added):
+    ''' Returns the change of count and magnitude sum per cube cell when events are replaced. '''
+    removed_cells, removed_mag = cube_cells(removed)
+    added_cells, added_mag = cube_cells(added)
+    signs = np.concatenate([-np.ones(len(removed_mag)), np.ones(len(added_mag))])
+    if len(signs) == 0:
+        return {}
+
+    cells, inverse = np.unique(np.concatenate([removed_cells, added_cells]), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    counts = np.bincount(inverse, weights=signs, minlength=len(cells)).astype(np.int64)
+    sums = np.bincount(inverse, weights=signs * np.concatenate([removed_mag, added_mag]), minlength=len(cells))
+
+    # Revisions that stay in the same cell only change the magnitude sum
+    changed = (counts != 0) | (np.abs(sums) > 1e-9)
+    return {tuple(cell): (int(count), float(total))
+            for cell, count, total in zip(cells[changed].tolist(), counts[changed], sums[changed])}
+
+
+def ensure_cube_indexes(cube):
+    cube.create_index([(name, ASCENDING) for name in DIMENSIONS], unique=True, name="cell")
+
+
+def is_built(collection):
+    return collection.find_one(BUILT) is not None
+
+
+def mark_built(collection):
+    collection.replace_one(BUILT, BUILT, upsert=True)
+
+
+def update_cube(cube, removed, added, rebuilding=False):
+    ''' Applies the changes of replacing the removed by the added features to the cube. Changes to a cube that was
+    never built would leave the global views counting only the new events, so they are refused. '''
+    if not rebuilding and not is_built(cube):
+        raise RuntimeError("The cube has not been built, run build_cube.py before storing events")
+
+    changes = cube_changes(removed, added)
+    if not changes:
+        return
+
+    cube.bulk_write([
+        UpdateOne(dict(zip(DIMENSIONS, cell)), {"$inc": {"count": count, "mag_sum": mag_sum}}, upsert=True)
+        for cell, (count, mag_sum) in changes.items()
+    ], ordered=False)
+
+
+def edge_range(edges, value_range):
+    ''' Returns the first and last bin that lie within the range. Bins are half-open, so events exactly on the upper
+    end of a range are not counted; the raw events are used where this matters. '''
+    lower = edges[:-1]
+    inside = np.flatnonzero((lower >= value_range[0]) & (lower < value_range[1]))
+    if len(inside) == 0:
+        return 0, -1
+    return int(inside[0]), int(inside[-1])
+
+
+def aggregate_cube(cube, start, end, mag_range, depth_range):
+    ''' Returns the same summaries as the aggregate of a catalog, at day and bin resolution. '''
+    first_mag, last_mag = edge_range(MAG_EDGES, mag_range)
+    first_depth, last_depth = edge_range(DEPTH_EDGES, depth_range)
+    match = {
+        "day": {"$gte": int(start // MS_PER_DAY), "$lt": int(-(-end // MS_PER_DAY))},
+        "mag": {"$gte": first_mag, "$lte": last_mag},
+        "depth": {"$gte": first_depth, "$lte": last_depth},
+        "count": {"$gt": 0},
+    }
+    result = next(cube.aggregate([
+        {"$match": match},
+        {"$facet": {
+            "mag": [{"$group": {"_id": "$mag", "count": {"$sum": "$count"}}}],
+            "depth": [{"$group": {"_id": "$depth", "count": {"$sum": "$count"}}}],
+            "density": [{"$group": {"_id": {"x": "$x", "y": "$y"}, "count": {"$sum": "$count"}}}],
+        }},
+    ], allowDiskUse=True))
+
+    mag = np.zeros(len(MAG_EDGES) - 1, dtype=np.int64)
+    for item in result["mag"]:
+        mag[item["_id"]] = item["count"]
+    depth = np.zeros(len(DEPTH_EDGES) - 1, dtype=np.int64)
+    for item in result["depth"]:
+        depth[item["_id"]] = item["count"]
+
+    density = result["density"]
+    return {
+        "mag": mag,
+        "depth": depth,
+        "density": cell_centers([item["_id"]["x"] for item in density], [item["_id"]["y"] for item in density],
+                                CUBE_CELL, [item["count"] for item in density]),
+    }
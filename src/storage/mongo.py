@@ -0,0 +1,180 @@
+''' Reads events from the mongodb collection that the retrieval scripts fill. '''
+
+import logging
+import time
+
+from pymongo import ASCENDING, DESCENDING
+
+import numpy as np
+
+from storage.aggregates import DEPTH_EDGES, MAG_EDGES, cell_centers
+from storage.columns import PROJECTION, features_to_columns
+from storage.cube import CUBE_COLLECTION, aggregate_cube, is_built
+from storage.rollups import ROLLUP_COLLECTION, read_rollups
+
+logger = logging.getLogger(__name__)
+
+# Compound indexes for the range filters of the app: the time range is usually the most selective predicate, the
+# magnitude-first index serves queries over long periods that only ask for strong earthquakes
+INDEXES = {
+    "time_mag_depth": [("properties.time", ASCENDING), ("properties.mag", ASCENDING),
+                       ("geometry.coordinates.2", ASCENDING)],
+    "mag_time_depth": [("properties.mag", ASCENDING), ("properties.time", ASCENDING),
+                       ("geometry.coordinates.2", ASCENDING)],
+    "regions_time_mag": [("regions", ASCENDING), ("properties.time", ASCENDING), ("properties.mag", ASCENDING)],
+    "lat_lon_time": [("geometry.coordinates.1", ASCENDING), ("geometry.coordinates.0", ASCENDING),
+                     ("properties.time", ASCENDING)],
+}
+
+# Seconds for which the version is answered without asking the database; caches see an ingestion run this much later
+VERSION_TTL = 10
+
+
+def within(bounds):
+    ''' Returns the conditions that select the events within the bounds [west, south, east, north]. These are plain
+    coordinate ranges, as the map shows: $geoWithin would treat the edges of a box as great circles. A view across
+    the antimeridian has two longitude ranges. '''
+    west, south, east, north = bounds
+    conditions = {"geometry.coordinates.1": {"$gte": south, "$lte": north}}
+    if west <= east:
+        conditions["geometry.coordinates.0"] = {"$gte": west, "$lte": east}
+    else:
+        conditions["$or"] = [{"geometry.coordinates.0": {"$gte": west}}, {"geometry.coordinates.0": {"$lte": east}}]
+    return conditions
+
+
+def plan_stages(plan):
+    ''' Yields the names of all stages in an explained query plan. '''
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from plan_stages(value)
+
+
+class MongoCatalog:
+    def __init__(self, collection, use_cube=True):
+        self.collection = collection
+        self.use_cube = use_cube
+        self.cube_built = False
+        self.checked_version = (None, -VERSION_TTL)
+
+    def version(self):
+        ''' Changes whenever an ingestion run completes. '''
+        version, checked = self.checked_version
+        if time.monotonic() - checked >= VERSION_TTL:
+            states = self.collection.database["sync"].find()
+            version = tuple(sorted((str(state["_id"]), str(state.get("synced"))) for state in states))
+            self.checked_version = (version, time.monotonic())
+        return version
+
+    def ensure_indexes(self):
+        existing = self.collection.index_information()
+        for name, keys in INDEXES.items():
+            if name not in existing:
+                self.collection.create_index(keys, name=name, background=True)
+
+    def build_query(self, start, end, mag_range, depth_range, location=None, bounds=None):
+        query = {
+            "properties.mag" : {"$gte": mag_range[0], "$lte": mag_range[1]},
+            "properties.time": {"$gte": start, "$lte": end},
+            "geometry.coordinates.2": {"$gte": depth_range[0], "$lte": depth_range[1]},
+        }
+
+        # Events are tagged with their regions at ingest, see ingest/regions.py
+        if location is not None:
+            query["regions"] = location
+
+        if bounds is not None:
+            query.update(within(bounds))
+
+        return query
+
+    def find(self, query, limit):
+        # The strongest events are kept when more events match than the limit. Large limits can exceed the memory
+        # of an in-memory sort, which the pinned pymongo cannot let a find spill to disk; a pipeline can.
+        return self.collection.aggregate([
+            {"$match": query},
+            {"$sort": {"properties.mag": DESCENDING}},
+            {"$limit": limit},
+            {"$project": PROJECTION},
+        ], allowDiskUse=True)
+
+    def explain(self, query, limit=5000):
+        ''' Returns the stages of the winning plan of a query. The $match and $sort of the pipeline in find are
+        planned like the equivalent find, which has the same explain output on every server version. '''
+        cursor = self.collection.find(query, PROJECTION).sort("properties.mag", DESCENDING).limit(limit)
+        explained = cursor.explain()
+        return list(plan_stages(explained["queryPlanner"]["winningPlan"]))
+
+    def verify_indexes(self, filters, limit=5000):
+        ''' Explains the queries of the given filter arguments and warns about the ones that scan the collection.
+        Returns True when all of them use an index. '''
+        uses_indexes = True
+        for arguments in filters:
+            query = self.build_query(*arguments)
+            stages = self.explain(query, limit)
+            if "COLLSCAN" in stages:
+                logger.warning("Query falls back to a collection scan: %s", query)
+                uses_indexes = False
+        return uses_indexes
+
+    def query(self, start, end, mag_range, depth_range, location=None, bounds=None, limit=5000):
+        ''' Returns the columns of the events within the ranges; times are in milliseconds since the epoch.
+        Bounds [west, south, east, north] restrict the events to the visible part of the map. When more events match
+        than the limit, the strongest ones are returned. '''
+        query = self.build_query(start, end, mag_range, depth_range, location, bounds)
+        return features_to_columns(list(self.find(query, limit)))
+
+    def has_cube(self):
+        ''' A cube that was never built would show zeros, the events are aggregated instead until it is. '''
+        if not self.cube_built:
+            self.cube_built = is_built(self.collection.database[CUBE_COLLECTION])
+        return self.cube_built
+
+    def aggregate(self, start, end, mag_range, depth_range, location=None, bounds=None, cell=1.0):
+        ''' Returns the magnitude and depth histograms and the counts per grid cell of all matching events. '''
+        # Global overviews are answered from the cube, regions and zoomed views need the events themselves
+        if location is None and bounds is None and self.use_cube and self.has_cube():
+            return aggregate_cube(self.collection.database[CUBE_COLLECTION], start, end, mag_range, depth_range)
+
+        query = self.build_query(start, end, mag_range, depth_range, location, bounds)
+        coordinate = lambda index: {"$arrayElemAt": ["$geometry.coordinates", index]}
+        cell_index = lambda index, offset: {"$floor": {"$divide": [{"$add": [coordinate(index), offset]}, cell]}}
+        result = next(self.collection.aggregate([
+            {"$match": query},
+            {"$facet": {
+                "mag": [{"$bucket": {"groupBy": "$properties.mag", "boundaries": MAG_EDGES.tolist(),
+                                     "default": "other"}}],
+                "depth": [{"$bucket": {"groupBy": coordinate(2), "boundaries": DEPTH_EDGES.tolist(),
+                                       "default": "other"}}],
+                "density": [{"$group": {"_id": {"x": cell_index(0, 180), "y": cell_index(1, 90)},
+                                        "count": {"$sum": 1}}}],
+            }},
+        ], allowDiskUse=True))
+
+        density = result["density"]
+        return {
+            "mag": bucket_counts(result["mag"], MAG_EDGES),
+            "depth": bucket_counts(result["depth"], DEPTH_EDGES),
+            "density": cell_centers([item["_id"]["x"] for item in density], [item["_id"]["y"] for item in density],
+                                    cell, [item["count"] for item in density]),
+        }
+
+    def rollup(self, start, end, mag_range, depth_range, location=None, bounds=None, period="4h"):
+        ''' Returns the event count, mean and largest magnitude per block of the period, read from the rollups. They
+        follow the magnitude and depth range at bin resolution and cover all coordinates of the location. '''
+        return read_rollups(self.collection.database[ROLLUP_COLLECTION], period, start, end, location, mag_range,
+                            depth_range)
+
+
+def bucket_counts(buckets, edges):
+    ''' Converts the output of a $bucket stage to an array of counts per bin. '''
+    counts = np.zeros(len(edges) - 1, dtype=np.int64)
+    for bucket in buckets:
+        if bucket["_id"] != "other":
+            counts[np.searchsorted(edges, bucket["_id"])] = bucket["count"]
+    return counts
@@ -0,0 +1,128 @@
+''' Columnar copy of the catalog, stored as parquet files partitioned by year. Queries push the time, magnitude and
+depth ranges down to the files, which are memory-mapped, and return the columns without building documents.
+This backend requires pyarrow, which is not needed otherwise. '''
+
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+
+from storage.aggregates import aggregate_columns
+from storage.rollups import rollup_columns
+from storage.columns import FIELDS, PROJECTION, empty_columns, features_to_columns, object_array
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("The parquet backend requires pyarrow, install it with: pip install pyarrow")
+
+
+def year_of(milliseconds):
+    return np.asarray(milliseconds, dtype=np.int64).astype("datetime64[ms]").astype("datetime64[Y]").astype(int) + 1970
+
+
+def to_table(columns):
+    _require_pyarrow()
+    types = {"regions": pa.list_(pa.string())}
+    return pa.table({name: pa.array(columns[name], type=types.get(name), from_pandas=True) for name in FIELDS})
+
+
+class ParquetCatalog:
+    def __init__(self, path):
+        _require_pyarrow()
+        self.path = path
+
+    def version(self):
+        ''' Changes whenever a partition is rewritten. '''
+        modified = [os.path.getmtime(os.path.join(root, name))
+                    for root, _, names in os.walk(self.path) for name in names if name.endswith(".parquet")]
+        return max(modified, default=None)
+
+    def write_year(self, year, columns):
+        ''' Replaces the partition of a year; the events are stored sorted by time to keep row groups selective. '''
+        order = np.argsort(columns["time"], kind="mergesort")
+        directory = os.path.join(self.path, "year={}".format(year))
+        os.makedirs(directory, exist_ok=True)
+        pq.write_table(to_table({name: column[order] for name, column in columns.items()}),
+                       os.path.join(directory, "part-0.parquet"), row_group_size=50000)
+
+    def select(self, start, end, mag_range, depth_range, location=None, bounds=None, fields=FIELDS):
+        ''' Returns a table of the matching events, reading only the given fields. '''
+        fields = list(fields) + [name for name in ["lon", "regions"] if name not in fields]
+        filters = [
+            ("year", ">=", int(year_of(start))), ("year", "<=", int(year_of(end))),
+            ("time", ">=", int(start)), ("time", "<=", int(end)),
+            ("mag", ">=", float(mag_range[0])), ("mag", "<=", float(mag_range[1])),
+            ("depth", ">=", float(depth_range[0])), ("depth", "<=", float(depth_range[1])),
+        ]
+        if bounds is not None:
+            west, south, east, north = bounds
+            filters += [("lat", ">=", float(south)), ("lat", "<=", float(north))]
+            if west <= east:
+                filters += [("lon", ">=", float(west)), ("lon", "<=", float(east))]
+        table = pq.read_table(self.path, columns=fields, filters=filters, memory_map=True)
+
+        if bounds is not None and bounds[0] > bounds[2]:
+            # Across the antimeridian the longitude range consists of two parts
+            lon = table["lon"]
+            table = table.filter(pc.or_(pc.greater_equal(lon, bounds[0]), pc.less_equal(lon, bounds[2])))
+
+        if location is not None:
+            regions = table["regions"].combine_chunks()
+            matches = pc.equal(pc.list_flatten(regions), location).to_numpy(zero_copy_only=False)
+            rows = np.unique(pc.list_parent_indices(regions).to_numpy()[matches])
+            table = table.take(pa.array(rows, type=pa.int64()))
+
+        return table
+
+    def query(self, start, end, mag_range, depth_range, location=None, bounds=None, limit=5000):
+        ''' Returns the columns of the events within the ranges; times are in milliseconds since the epoch.
+        Bounds [west, south, east, north] restrict the events to the visible part of the map. When more events match
+        than the limit, the strongest ones are returned. '''
+        if not os.path.isdir(self.path):
+            return empty_columns()
+
+        table = self.select(start, end, mag_range, depth_range, location, bounds)
+        if table.num_rows > limit:
+            strongest = np.argsort(-table["mag"].to_numpy(), kind="mergesort")[:limit]
+            table = table.take(pa.array(strongest))
+        columns = {name: table[name].to_numpy().astype(FIELDS[name], copy=False) for name in FIELDS}
+        columns["regions"] = object_array(table["regions"].to_pylist())
+        return columns
+
+    def aggregate(self, start, end, mag_range, depth_range, location=None, bounds=None, cell=1.0):
+        ''' Returns the magnitude and depth histograms and the counts per grid cell of all matching events. '''
+        if not os.path.isdir(self.path):
+            return aggregate_columns(empty_columns(), cell)
+
+        table = self.select(start, end, mag_range, depth_range, location, bounds, fields=["mag", "depth", "lat"])
+        return aggregate_columns({name: table[name].to_numpy() for name in ["mag", "depth", "lon", "lat"]}, cell)
+
+    def rollup(self, start, end, mag_range, depth_range, location=None, bounds=None, period="4h"):
+        ''' Returns the event count, mean and largest magnitude per block of the period of the events within the
+        magnitude and depth range. Like the rollups of the mongodb backend they cover all coordinates of the
+        location. '''
+        if not os.path.isdir(self.path):
+            return rollup_columns([], [], period)
+
+        table = self.select(start, end, mag_range, depth_range, location, fields=["time", "mag"])
+        return rollup_columns(table["time"].to_numpy(), table["mag"].to_numpy(), period)
+
+
+def export(collection, catalog, first_year=2000, last_year=None):
+    ''' Writes every year of the mongodb collection to the parquet catalog. '''
+    last_year = last_year or datetime.utcnow().year
+    for year in range(first_year, last_year + 1):
+        start = datetime(year, 1, 1, tzinfo=timezone.utc).timestamp() * 1000
+        end = datetime(year + 1, 1, 1, tzinfo=timezone.utc).timestamp() * 1000
+        features = list(collection.find({"properties.time": {"$gte": start, "$lt": end}}, PROJECTION))
+        if features:
+            catalog.write_year(year, features_to_columns(features))
+        print("Exported", len(features), "earthquakes of", year)
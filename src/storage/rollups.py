@@ -0,0 +1,183 @@
+''' Materialized magnitude series: the number of events, their magnitude sum and the largest magnitude per 4 hour and
+per day block, for the whole world and for every region. Like the cube they are split by magnitude and depth bin, so
+that the series follow the filters of the sidebar at bin resolution. They are kept up to date when events are stored,
+so that the time series views read a few thousand documents instead of all events of the period. '''
+
+import numpy as np
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+from storage.aggregates import DEPTH_EDGES, MAG_EDGES
+from storage.cube import bin_index, edge_range, is_built
+
+ROLLUP_COLLECTION = "rollups"
+KEY = ["period", "region", "start", "mag", "depth"]
+
+# Length of the blocks in milliseconds; blocks start at midnight UTC
+PERIODS = {"4h": 4 * 3600 * 1000, "1d": 24 * 3600 * 1000}
+
+# Region of the series over all events
+GLOBAL = "all"
+
+# Fields of the stored events the rollups are computed from
+PROJECTION = {"_id": False, "geometry.coordinates": True, "properties.mag": True, "properties.time": True,
+              "regions": True}
+
+
+def empty_series():
+    return {"time": np.empty(0, dtype=np.int64), "count": np.empty(0, dtype=np.int64),
+            "mean": np.empty(0), "max": np.empty(0)}
+
+
+def rollup_entries(features):
+    ''' Returns the region, time, magnitude and depth of every feature, once for every series the feature counts
+    in. '''
+    regions = [[GLOBAL] + list(feature.get("regions") or []) for feature in features]
+    repeats = np.array([len(names) for names in regions], dtype=np.int64)
+    time = np.array([feature["properties"]["time"] for feature in features], dtype=np.int64)
+    mag = np.array([feature["properties"]["mag"] for feature in features], dtype=np.float64)
+    depth = np.array([feature["geometry"]["coordinates"][2] for feature in features], dtype=np.float64)
+    region = np.array([name for names in regions for name in names], dtype=object)
+    return region, np.repeat(time, repeats), np.repeat(mag, repeats), np.repeat(depth, repeats)
+
+
+def rollup_changes(removed, added):
+    ''' Returns per (period, region, start, magnitude bin, depth bin) the change of count and magnitude sum together
+    with the largest added and the largest removed magnitude. '''
+    if not removed and not added:
+        return {}
+
+    removed_region, removed_time, removed_mag, removed_depth = rollup_entries(removed)
+    added_region, added_time, added_mag, added_depth = rollup_entries(added)
+    region = np.concatenate([removed_region, added_region]).astype(str)
+    time = np.concatenate([removed_time, added_time])
+    mag = np.concatenate([removed_mag, added_mag])
+    bins = np.column_stack([bin_index(mag, MAG_EDGES), bin_index(np.concatenate([removed_depth, added_depth]),
+                                                                 DEPTH_EDGES)])
+    signs = np.concatenate([-np.ones(len(removed_mag)), np.ones(len(added_mag))])
+    names, region_index = np.unique(region, return_inverse=True)
+
+    changes = {}
+    for period, length in PERIODS.items():
+        keys, inverse = np.unique(np.column_stack([region_index, time // length * length, bins]), axis=0,
+                                  return_inverse=True)
+        inverse = inverse.reshape(-1)
+        counts = np.bincount(inverse, weights=signs, minlength=len(keys)).astype(np.int64)
+        sums = np.bincount(inverse, weights=signs * mag, minlength=len(keys))
+        largest_added = np.full(len(keys), -np.inf)
+        np.maximum.at(largest_added, inverse[signs > 0], mag[signs > 0])
+        largest_removed = np.full(len(keys), -np.inf)
+        np.maximum.at(largest_removed, inverse[signs < 0], mag[signs < 0])
+
+        for (name, start, mag_bin, depth_bin), count, total, added_max, removed_max in zip(
+                keys.tolist(), counts, sums, largest_added, largest_removed):
+            changes[(period, str(names[name]), start, mag_bin, depth_bin)] = (int(count), float(total), added_max,
+                                                                              removed_max)
+    return changes
+
+
+def ensure_rollup_indexes(rollups):
+    rollups.create_index([(name, ASCENDING) for name in KEY], unique=True, name="series")
+
+
+def bin_condition(edges, index):
+    ''' Returns the condition for the values of a bin; the outer bins also hold the values beyond the edges. '''
+    condition = {}
+    if index > 0:
+        condition["$gte"] = float(edges[index])
+    if index < len(edges) - 2:
+        condition["$lt"] = float(edges[index + 1])
+    return condition or {"$exists": True}
+
+
+def largest_magnitude(collection, period, region, start, mag, depth):
+    ''' Reads the largest magnitude of a block and bin from the stored events. '''
+    query = {
+        "properties.time": {"$gte": start, "$lt": start + PERIODS[period]},
+        "properties.mag": bin_condition(MAG_EDGES, mag),
+        "geometry.coordinates.2": bin_condition(DEPTH_EDGES, depth),
+    }
+    if region != GLOBAL:
+        query["regions"] = region
+    strongest = list(collection.find(query, {"_id": False, "properties.mag": True})
+                     .sort("properties.mag", DESCENDING).limit(1))
+    return strongest[0]["properties"]["mag"] if strongest else None
+
+
+def update_rollups(rollups, collection, removed, added, rebuilding=False):
+    ''' Applies the changes of replacing the removed by the added features to the rollups. The collection already
+    holds the added features; it is read for the blocks whose largest magnitude may have been removed. '''
+    if not rebuilding and not is_built(rollups):
+        raise RuntimeError("The rollups have not been built, run build_rollups.py before storing events")
+
+    operations = []
+    stale = []
+    for key, (count, mag_sum, added_max, removed_max) in rollup_changes(removed, added).items():
+        if removed_max > added_max:
+            stale.append(key)
+        elif count == 0 and abs(mag_sum) < 1e-9:
+            # Revisions that keep the magnitude change nothing
+            continue
+
+        update = {"$inc": {"count": count, "mag_sum": mag_sum}}
+        if added_max > -np.inf:
+            update["$max"] = {"mag_max": float(added_max)}
+        operations.append(UpdateOne(dict(zip(KEY, key)), update, upsert=True))
+
+    if operations:
+        rollups.bulk_write(operations, ordered=False)
+
+    # A maximum cannot be decremented, it is recomputed from the events of the block
+    for key in stale:
+        rollups.update_one(dict(zip(KEY, key)), {"$set": {"mag_max": largest_magnitude(collection, *key)}})
+
+
+def read_rollups(rollups, period, start, end, region=None, mag_range=None, depth_range=None):
+    ''' Returns the series of the blocks that overlap [start, end] and hold events within the magnitude and depth
+    range, at bin resolution like the cube. '''
+    length = PERIODS[period]
+    match = {
+        "period": period,
+        "region": region or GLOBAL,
+        "start": {"$gte": int(start // length * length), "$lte": int(end)},
+        "count": {"$gt": 0},
+    }
+    for name, edges, value_range in [("mag", MAG_EDGES, mag_range), ("depth", DEPTH_EDGES, depth_range)]:
+        if value_range is not None:
+            first, last = edge_range(edges, value_range)
+            match[name] = {"$gte": first, "$lte": last}
+
+    documents = list(rollups.aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$start", "count": {"$sum": "$count"}, "mag_sum": {"$sum": "$mag_sum"},
+                    "mag_max": {"$max": "$mag_max"}}},
+        {"$sort": {"_id": ASCENDING}},
+    ], allowDiskUse=True))
+    if not documents:
+        return empty_series()
+
+    count = np.array([document["count"] for document in documents], dtype=np.int64)
+    return {
+        "time": np.array([document["_id"] for document in documents], dtype=np.int64),
+        "count": count,
+        "mean": np.array([document["mag_sum"] for document in documents], dtype=np.float64) / count,
+        "max": np.array([document["mag_max"] for document in documents], dtype=np.float64),
+    }
+
+
+def rollup_columns(time, mag, period):
+    ''' Computes the series of a period from columns that are already in memory. '''
+    if len(time) == 0:
+        return empty_series()
+
+    length = PERIODS[period]
+    starts, inverse = np.unique(np.asarray(time, dtype=np.int64) // length * length, return_inverse=True)
+    mag = np.asarray(mag, dtype=np.float64)
+    count = np.bincount(inverse, minlength=len(starts))
+    largest = np.full(len(starts), -np.inf)
+    np.maximum.at(largest, inverse, mag)
+    return {
+        "time": starts,
+        "count": count.astype(np.int64),
+        "mean": np.bincount(inverse, weights=mag, minlength=len(starts)) / count,
+        "max": largest,
+    }
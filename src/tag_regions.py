@@ -0,0 +1,29 @@
+''' This module (re)assigns the region tags and offshore distances of all stored earthquakes, e.g. after a region
+has been added to resources/regions.json or the coastline has been replaced. New events are tagged when they are
+stored. '''
+
+import pymongo
+from pymongo import UpdateOne
+
+from ingest.coast import get_coastline
+from ingest.engine import BATCH_SIZE
+from ingest.regions import region_tags
+from ingest.stream import batches
+
+# Connect to the db
+mongo = pymongo.MongoClient("mongodb://localhost:27017/")
+collection = mongo["map-earthquake-data"]["earthquakes"]
+
+total = 0
+for events in batches(collection.find({}, {"geometry.coordinates": True}), BATCH_SIZE):
+    lon = [event["geometry"]["coordinates"][0] for event in events]
+    lat = [event["geometry"]["coordinates"][1] for event in events]
+    tags = region_tags(lon, lat)
+    distances = get_coastline().offshore_km(lon, lat)
+    collection.bulk_write([UpdateOne({"_id": event["_id"]},
+                                     {"$set": {"regions": regions, "offshore_km": round(float(distance), 1)}})
+                           for event, regions, distance in zip(events, tags, distances)], ordered=False)
+    total += len(events)
+    print("Tagged", total, "earthquakes")
+
+print("The region tags have been updated! Run build_rollups.py to update the regional time series.")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules of the app import each other relative to src, as when the scripts are run from there
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
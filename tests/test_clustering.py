@@ -0,0 +1,35 @@
+''' OPTICS on the shared radius graph must give the result of scikit-learn's own OPTICS. '''
+
+import numpy as np
+from sklearn.cluster import OPTICS
+
+from graphs.clustering import EPS_KM, MIN_SAMPLES, optics_labels, optics_ordering
+from graphs.spatial import EARTH_RADIUS_KM, SpatialIndex
+
+
+def clustered_points(n, seed=0):
+    random = np.random.RandomState(seed)
+    centers = random.uniform([-180, -60], [180, 60], (20, 2))
+    points = centers[random.randint(0, len(centers), n)] + random.normal(0, random.uniform(0.3, 3, (n, 1)), (n, 2))
+    points[:n // 5] = random.uniform([-180, -60], [180, 60], (n // 5, 2))
+    return np.clip(points[:, 0], -180, 180), np.clip(points[:, 1], -89, 89)
+
+
+def test_optics_matches_scikit_learn():
+    index = SpatialIndex(*clustered_points(1500))
+    max_eps = EPS_KM / EARTH_RADIUS_KM
+    expected = OPTICS(min_samples=MIN_SAMPLES, max_eps=max_eps, metric='haversine',
+                      algorithm='ball_tree').fit(index.points)
+
+    graph = index.radius_graph(EPS_KM)
+    ordering, reachability, predecessor = optics_ordering(graph, max_eps, MIN_SAMPLES)
+    np.testing.assert_array_equal(ordering, expected.ordering_)
+    np.testing.assert_allclose(reachability, expected.reachability_)
+    np.testing.assert_array_equal(predecessor, expected.predecessor_)
+    np.testing.assert_array_equal(optics_labels(graph, max_eps, MIN_SAMPLES), expected.labels_)
+
+
+def test_optics_of_few_events_is_noise():
+    index = SpatialIndex(np.zeros(3), np.zeros(3))
+    labels = optics_labels(index.radius_graph(EPS_KM), EPS_KM / EARTH_RADIUS_KM, MIN_SAMPLES)
+    np.testing.assert_array_equal(labels, [-1, -1, -1])
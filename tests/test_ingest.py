@@ -0,0 +1,169 @@
+''' Runs the ingestion end to end against a local stand-in for the FDSN event service. '''
+
+import json
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from ingest.engine import Checkpoint, make_windows, run, uncovered
+from ingest.planner import Window
+from ingest.fdsn import DATE_FORMAT, FdsnClient
+from ingest.store import ensure_indexes
+
+
+def epoch_ms(moment):
+    return int(moment.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def make_events():
+    random = np.random.RandomState(0)
+    start, end = epoch_ms(datetime(2001, 1, 1)), epoch_ms(datetime(2003, 1, 1))
+    times = sorted(random.randint(start, end, 120).tolist())
+    # A burst within one minute, more than a page holds, which the planner cannot split
+    burst = epoch_ms(datetime(2002, 6, 1, 12, 0, 10))
+    times += [burst + 1000 * index for index in range(12)]
+    return [{
+        "type": "Feature",
+        "id": "us{}".format(index),
+        "properties": {"mag": round(float(random.uniform(2.5, 7)), 1), "time": time, "status": "reviewed",
+                       "sig": 100, "tsunami": 0, "place": "somewhere"},
+        "geometry": {"type": "Point", "coordinates": [float(random.uniform(-180, 180)),
+                                                      float(random.uniform(-60, 60)), 10.0]},
+    } for index, time in enumerate(sorted(times))]
+
+
+class StandIn(BaseHTTPRequestHandler):
+    ''' Answers the count and query endpoints from the events of the server. Failures holds per endpoint the status
+    codes of the next responses, which lets requests fail before they are answered. '''
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {name: values[0] for name, values in parse_qs(url.query).items()}
+        endpoint = url.path.rsplit("/", 1)[-1]
+        self.server.requests.append((endpoint, params))
+
+        failures = self.server.failures.get(endpoint)
+        if failures and failures(params):
+            return self.respond(503, {"error": "unavailable"})
+
+        start = epoch_ms(datetime.strptime(params["starttime"], DATE_FORMAT))
+        end = epoch_ms(datetime.strptime(params["endtime"], DATE_FORMAT))
+        selected = [event for event in self.server.events if start <= event["properties"]["time"] < end]
+        if endpoint == "count":
+            return self.respond(200, {"count": len(selected)})
+
+        offset, limit = int(params["offset"]), int(params["limit"])
+        return self.respond(200, {"type": "FeatureCollection", "features": selected[offset - 1:offset - 1 + limit]})
+
+    def respond(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = HTTPServer(("127.0.0.1", 0), StandIn)
+    server.events = make_events()
+    server.requests = []
+    server.failures = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def database():
+    database = mongomock.MongoClient().db
+    ensure_indexes(database.earthquakes)
+    return database
+
+
+def client_of(server, retries=3):
+    return FdsnClient("http://127.0.0.1:{}/fdsnws/event/1".format(server.server_port), pool_size=1, retries=retries)
+
+
+def fail_times(count):
+    ''' Returns a failure rule that fails the next count requests. '''
+    remaining = [count]
+
+    def fails(params):
+        remaining[0] -= 1
+        return remaining[0] >= 0
+    return fails
+
+
+def stored_ids(database):
+    return sorted(event["id"] for event in database.earthquakes.find({}, {"id": True}))
+
+
+def run_windows(server, database, client, limit=5):
+    windows = make_windows(datetime(2001, 1, 1), datetime(2003, 1, 1))
+    return run(client, database.earthquakes, Checkpoint(database.checkpoints), windows, workers=1, limit=limit)
+
+
+def test_run_stores_every_event(server, database):
+    total, failed = run_windows(server, database, client_of(server))
+
+    assert failed == 0
+    assert total == len(server.events)
+    assert stored_ids(database) == sorted(event["id"] for event in server.events)
+
+    # The burst was fetched in pages of the limit
+    offsets = [int(params["offset"]) for endpoint, params in server.requests if endpoint == "query"]
+    assert max(offsets) == 11
+
+
+def test_transient_errors_are_retried(server, database):
+    server.failures["query"] = fail_times(2)
+    server.failures["count"] = fail_times(1)
+    total, failed = run_windows(server, database, client_of(server))
+
+    assert failed == 0
+    assert total == len(server.events)
+
+
+def test_failed_windows_are_retried_by_the_next_run(server, database):
+    # Every query of 2002 fails, the windows of 2001 are stored and checkpointed
+    server.failures["query"] = lambda params: params["starttime"].startswith("2002")
+    total, failed = run_windows(server, database, client_of(server, retries=0))
+    assert failed > 0
+    assert stored_ids(database) == sorted(event["id"] for event in server.events
+                                          if event["properties"]["time"] < epoch_ms(datetime(2002, 1, 1)))
+
+    # The next run only asks for the time that is not checkpointed, even though new events make the planner cut it
+    # into other windows
+    added = make_events()[:30]
+    for index, event in enumerate(added):
+        event["id"] = "added{}".format(index)
+        event["properties"]["time"] = epoch_ms(datetime(2002, 3, 1)) + 60000 * index
+    server.events = sorted(server.events + added, key=lambda event: event["properties"]["time"])
+    server.failures.clear()
+    server.requests.clear()
+    total, failed = run_windows(server, database, client_of(server))
+    assert failed == 0
+    assert stored_ids(database) == sorted(event["id"] for event in server.events)
+    assert all(not params["starttime"].startswith("2001") for endpoint, params in server.requests)
+
+
+def test_uncovered_time():
+    day = lambda number: datetime(2001, 1, number)
+    window = Window(day(1), day(10))
+    spans = [Window(day(3), day(4)), Window(day(2), day(3)), Window(day(6), day(7)), Window(day(9), day(12))]
+    assert uncovered(window, spans) == [Window(day(1), day(2)), Window(day(4), day(6)), Window(day(7), day(9))]
+    assert uncovered(window, [Window(day(1), day(10))]) == []
+    assert uncovered(window, []) == [window]
@@ -0,0 +1,84 @@
+''' Storing events more than once must not change the rollups. '''
+
+import copy
+
+import numpy as np
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from ingest.store import ensure_indexes, store_events
+from storage.rollups import ROLLUP_COLLECTION, read_rollups, rollup_columns
+
+DAY = 24 * 3600 * 1000
+
+
+def make_events(first, last, seed=0):
+    random = np.random.RandomState(seed)
+    return [{
+        "type": "Feature",
+        "id": "us{}".format(index),
+        "properties": {"mag": round(float(random.uniform(2, 7)), 1), "time": int(random.randint(0, 20 * DAY)),
+                       "status": "reviewed", "sig": 100, "tsunami": 0, "place": "somewhere"},
+        "geometry": {"type": "Point", "coordinates": [float(random.uniform(-180, 180)),
+                                                      float(random.uniform(-60, 60)), float(random.uniform(0, 600))]},
+    } for index in range(first, last)]
+
+
+@pytest.fixture
+def collection():
+    collection = mongomock.MongoClient().db.earthquakes
+    ensure_indexes(collection)
+    return collection
+
+
+def series(collection, period="1d"):
+    return read_rollups(collection.database[ROLLUP_COLLECTION], period, 0, 30 * DAY)
+
+
+def assert_matches_events(collection, events):
+    expected = rollup_columns([event["properties"]["time"] for event in events],
+                              [event["properties"]["mag"] for event in events], "1d")
+    stored = series(collection)
+    for name in ["time", "count", "mean", "max"]:
+        np.testing.assert_allclose(stored[name], expected[name])
+
+
+def test_storing_a_batch_twice(collection):
+    events = make_events(0, 300)
+    store_events(collection, copy.deepcopy(events))
+    assert_matches_events(collection, events)
+
+    store_events(collection, copy.deepcopy(events))
+    assert_matches_events(collection, events)
+
+
+def test_overlapping_batches(collection):
+    events = make_events(0, 400)
+    first, second = events[:250], events[150:]
+    for batch in [first, second, second, first]:
+        store_events(collection, copy.deepcopy(batch))
+    assert_matches_events(collection, events)
+    assert collection.count_documents({}) == len(events)
+
+
+def test_revised_magnitudes(collection):
+    events = make_events(0, 200)
+    store_events(collection, copy.deepcopy(events))
+
+    # The strongest events are revised downwards twice, as when a window is retried
+    revised = copy.deepcopy(sorted(events, key=lambda event: -event["properties"]["mag"])[:20])
+    for event in revised:
+        event["properties"]["mag"] -= 1
+    store_events(collection, copy.deepcopy(revised))
+    store_events(collection, copy.deepcopy(revised))
+
+    by_id = {event["id"]: event for event in events + revised}
+    assert_matches_events(collection, list(by_id.values()))
+
+
+def test_unbuilt_rollups_are_refused(collection):
+    store_events(collection, make_events(0, 10))
+    collection.database[ROLLUP_COLLECTION].drop()
+    with pytest.raises(RuntimeError):
+        store_events(collection, make_events(10, 20))